@@ -0,0 +1,97 @@
+import numpy as np
+
+# Winning lines of a 3x3 board, in the same order as Board.sub_winner.
+WINNING_COMBOS = np.array([
+    [0,1,2],
+    [3,4,5],
+    [6,7,8],
+    [0,4,8],
+    [2,4,6],
+    [0,3,6],
+    [1,4,7],
+    [2,5,8]
+])
+
+
+def line_winner(boards, player):
+    # Takes an (n, 9) array of 3x3 boards and an (n,) array of players.
+    # Returns an (n,) bool array, True where the player has a line.
+    lines = boards[:, WINNING_COMBOS] == player[:, None, None]
+    return lines.all(axis=2).any(axis=1)
+
+
+class BatchRollout(object):
+    # Plays many random games in lockstep.  Each game is a row of an
+    # (n, 92) int8 array laid out like the tuple states of
+    # ultimatetictactoe_online.Board: 81 cells, 9 meta cells, the
+    # player to move and the last move.  Every step picks a uniformly
+    # random legal move in every unfinished game with array operations
+    # only.
+    def __init__(self, seed=None, max_moves=81):
+        self.rng = np.random.default_rng(seed)
+        self.max_moves = max_moves
+
+    def legal_mask(self, games):
+        # Returns an (n, 81) bool array of the legal moves in each game.
+        cells = games[:, :81]
+        meta = games[:, 81:90]
+        last = games[:, 91].astype(np.int64)
+        rows = np.arange(len(games))
+
+        open_quadrants = meta == -1
+        target = np.where(last >= 0, last % 9, 0)
+        forced = (last >= 0) & open_quadrants[rows, target]
+        allowed = np.where(forced[:, None], np.arange(9)[None, :] == target[:, None], open_quadrants)
+        return (cells == -1) & np.repeat(allowed, 9, axis=1)
+
+    def play(self, games, moves):
+        # Applies one move to each game in place.
+        rows = np.arange(len(games))
+        player = games[:, 90]
+        games[rows, moves] = player
+
+        quadrant = moves // 9
+        boards = games[rows[:, None], quadrant[:, None] * 9 + np.arange(9)[None, :]]
+        won = line_winner(boards, player)
+        games[rows[won], 81 + quadrant[won]] = player[won]
+        # A full sub-board counts as drawn, even if the last mark won it.
+        full = (boards != -1).all(axis=1)
+        games[rows[full], 81 + quadrant[full]] = 0
+
+        games[:, 91] = moves
+        games[:, 90] = 3 - player
+
+    def run(self, states):
+        # Plays out every state in `states` (tuples or an (n, 92)
+        # array).  Returns an (n,) array holding the winner of each
+        # game, -1 for a draw, or 0 if it didn't finish in max_moves.
+        games = np.array(states, dtype=np.int8).reshape(-1, 92)
+        winners = np.zeros(len(games), dtype=np.int8)
+        active = np.arange(len(games))
+
+        for _ in range(self.max_moves):
+            if not len(active):
+                break
+            batch = games[active]
+            legal = self.legal_mask(batch)
+
+            stuck = ~legal.any(axis=1)
+            winners[active[stuck]] = -1
+
+            # Taking the largest random key over the legal cells picks
+            # one of them uniformly.
+            keys = self.rng.random(legal.shape)
+            keys[~legal] = -1
+            moves = keys.argmax(axis=1)
+
+            live = ~stuck
+            batch = batch[live]
+            self.play(batch, moves[live])
+            games[active[live]] = batch
+
+            mover = 3 - batch[:, 90]
+            done = line_winner(batch[:, 81:90], mover)
+            winners[active[live][done]] = mover[done]
+            active = active[live][~done]
+
+        return winners
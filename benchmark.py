@@ -0,0 +1,157 @@
+import sys
+import json
+import random
+import argparse
+import platform
+from time import perf_counter
+
+import ultimatetictactoe_online
+import montecarlo_base
+import montecarlo_new
+import montecarlo_tree
+import montecarlo_arrays
+import bitboard
+
+SEED = 12345
+
+# The mid-game position from test_state.py.
+MIDGAME = (-1, -1, -1, -1, 2, 2, -1, -1, -1, -1, -1, -1, 1, 1, -1, -1, -1, 2, -1, -1, -1, 1, 1, 1, -1, -1, -1, -1, -1, 2, -1, -1, 2, 2, 2, -1, -1, 2, 2, -1, 1, 2, -1, 2, 2, -1, -1, -1, 1, 1, 1, 2, 1, -1, -1, 1, 2, -1, 1, -1, -1, -1, -1, 1, -1, -1, 1, 1, -1, -1, 2, -1, 1, -1, -1, -1, 1, 2, 1, -1, 2, -1, -1, 1, -1, 2, 1, -1, -1, -1, 2, 12)
+
+START = tuple([-1 for _ in range(9*9)] + [-1 for _ in range(9)] + [1, -1])
+
+POSITIONS = {'start': START, 'midgame': MIDGAME}
+
+BOARDS = {
+    'tuple': ultimatetictactoe_online.Board,
+    'bitboard': bitboard.Board,
+}
+
+ENGINES = {
+    'montecarlo_base': montecarlo_base.MonteCarlo,
+    'montecarlo_new': montecarlo_new.MonteCarlo,
+    'online': ultimatetictactoe_online.MonteCarlo,
+    'montecarlo_tree': montecarlo_tree.MonteCarlo,
+    'montecarlo_arrays': montecarlo_arrays.MonteCarlo,
+}
+
+
+def convert(board, state):
+    # Returns `state` in the representation `board` works with.
+    if hasattr(board, 'from_tuple'):
+        return board.from_tuple(state)
+    return state
+
+
+def perft(board, state, depth):
+    # Counts the positions reachable from `state` in exactly `depth`
+    # moves, not expanding games that are already won.
+    if depth == 0 or board.winner([state]):
+        return 1
+    nodes = 0
+    for play in board.legal_plays([state]):
+        nodes += perft(board, board.next_state(state, play), depth - 1)
+    return nodes
+
+
+def bench_perft(depth):
+    results = []
+    for board_name, cls in sorted(BOARDS.items()):
+        board = cls()
+        for position_name, state in sorted(POSITIONS.items()):
+            state = convert(board, state)
+            begin = perf_counter()
+            nodes = perft(board, state, depth)
+            elapsed = perf_counter() - begin
+            results.append({'board': board_name, 'position': position_name, 'depth': depth,
+                            'nodes': nodes, 'seconds': elapsed, 'nodes_per_second': nodes / elapsed})
+    return results
+
+
+def bench_simulations(simulations):
+    results = []
+    for engine_name, cls in sorted(ENGINES.items()):
+        for board_name, board_cls in sorted(BOARDS.items()):
+            board = board_cls()
+            for position_name, state in sorted(POSITIONS.items()):
+                random.seed(SEED)
+                engine = cls(board, silent=True)
+                engine.update(convert(board, state))
+                engine.max_depth = 0
+                if isinstance(engine, montecarlo_tree.MonteCarlo):
+                    engine.root = montecarlo_tree.Node(-1, 0, engine.states[-1])
+                begin = perf_counter()
+                for _ in range(simulations):
+                    engine.run_simulation()
+                elapsed = perf_counter() - begin
+                results.append({'engine': engine_name, 'board': board_name, 'position': position_name,
+                                'simulations': simulations, 'seconds': elapsed,
+                                'simulations_per_second': simulations / elapsed})
+    return results
+
+
+def sample_states(count):
+    # Returns `count` states from random games, in tuple form.
+    random.seed(SEED)
+    board = ultimatetictactoe_online.Board()
+    states = []
+    while len(states) < count:
+        state = START
+        while len(states) < count:
+            legal = board.legal_plays([state])
+            if not legal or board.winner([state]):
+                break
+            state = board.next_state(state, random.choice(legal))
+            states.append(state)
+    return states
+
+
+def bench_winner(count):
+    tuples = sample_states(count)
+    results = []
+    for board_name, cls in sorted(BOARDS.items()):
+        board = cls()
+        states = [convert(board, state) for state in tuples]
+
+        begin = perf_counter()
+        for state in states:
+            board.winner([state])
+        elapsed = perf_counter() - begin
+        results.append({'board': board_name, 'function': 'winner', 'calls': count,
+                        'seconds': elapsed, 'calls_per_second': count / elapsed})
+
+        quadrants = [state[(i % 9) * 9:(i % 9 + 1) * 9] for i, state in enumerate(tuples)]
+        begin = perf_counter()
+        for quadrant in quadrants:
+            board.sub_winner(quadrant)
+        elapsed = perf_counter() - begin
+        results.append({'board': board_name, 'function': 'sub_winner', 'calls': count,
+                        'seconds': elapsed, 'calls_per_second': count / elapsed})
+    return results
+
+
+def run(depth=3, simulations=200, calls=100000):
+    # Runs every benchmark and returns the results as a dict.
+    return {
+        'python': platform.python_version(),
+        'seed': SEED,
+        'perft': bench_perft(depth),
+        'simulations': bench_simulations(simulations),
+        'winner': bench_winner(calls),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark move generation and search throughput.')
+    parser.add_argument('--depth', type=int, default=3, help='perft depth')
+    parser.add_argument('--simulations', type=int, default=200, help='run_simulation calls per engine')
+    parser.add_argument('--calls', type=int, default=100000, help='winner/sub_winner calls')
+    parser.add_argument('--output', help='JSON file to write (default: stdout)')
+    args = parser.parse_args()
+
+    results = run(args.depth, args.simulations, args.calls)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
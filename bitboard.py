@@ -0,0 +1,560 @@
+from random import randint, choice, random, Random
+
+# Winning lines of a 3x3 board, in the same order as Board.sub_winner.
+WINNING_COMBOS = [
+    [0,1,2],
+    [3,4,5],
+    [6,7,8],
+    [0,4,8],
+    [2,4,6],
+    [0,3,6],
+    [1,4,7],
+    [2,5,8]
+]
+
+LINE_MASKS = [sum(1 << x for x in combo) for combo in WINNING_COMBOS]
+
+# WIN_TABLE[mask] is True when the 9-bit mask contains a complete line.
+WIN_TABLE = [any(mask & line == line for line in LINE_MASKS) for mask in range(512)]
+
+# LIVE_TABLE[blocked] is True when some line avoids every cell of the
+# 9-bit mask `blocked`.  On the meta-board, a player's blocked cells are
+# the sub-boards won by the opponent or drawn, so this says whether they
+# can still win the game.
+LIVE_TABLE = [not all(mask & line for line in LINE_MASKS) for mask in range(512)]
+
+# CELLS[mask] lists the cell offsets (0-8) of the bits set in a 9-bit mask.
+CELLS = [tuple(c for c in range(9) if mask & (1 << c)) for mask in range(512)]
+
+# POPCOUNT[mask] is the number of bits set in a 9-bit mask.
+POPCOUNT = [len(cells) for cells in CELLS]
+
+# QUADRANT_MOVES[quadrant][mask] lists the moves (0-80) of the cells of
+# `quadrant` whose bits are set in a 9-bit mask.
+QUADRANT_MOVES = [[tuple(q * 9 + c for c in cells) for cells in CELLS] for q in range(9)]
+
+BIT = [1 << i for i in range(9)]
+
+FULL = 511
+
+ALL_CELLS = (1 << 81) - 1
+
+# Zobrist keys.  A state's key is the XOR of ZOBRIST_CELLS[player][cell]
+# for every mark on the board, ZOBRIST_LAST[last move + 1] and, when
+# player 2 is to move, ZOBRIST_SIDE.  The generator is seeded with a
+# constant so that keys are the same in every process and every run.
+_zobrist_random = Random(0x5eed)
+ZOBRIST_CELLS = [None] + [[_zobrist_random.getrandbits(64) for _ in range(81)] for _ in range(2)]
+ZOBRIST_LAST = [_zobrist_random.getrandbits(64) for _ in range(82)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+
+def zobrist(state):
+    # Computes the Zobrist key of a BitState or 92-element tuple state
+    # from scratch.
+    key = ZOBRIST_LAST[state[91] + 1]
+    if state[90] == 2:
+        key ^= ZOBRIST_SIDE
+    for i in range(81):
+        if state[i] > 0:
+            key ^= ZOBRIST_CELLS[state[i]][i]
+    return key
+
+
+class BitState(object):
+    # An immutable game state.  Each player's marks are held as nine
+    # 9-bit sub-board masks packed into one integer (sub-board q lives
+    # in bits 9*q .. 9*q+8), plus a 9-bit meta-board mask of the
+    # sub-boards they have won.  `drawn` marks the sub-boards that were
+    # filled without a winner.
+    #
+    # Indexing with an integer returns the value the 92-element tuple
+    # of ultimatetictactoe_online.Board would hold at that position, so
+    # code written against the tuple format (state[90], state[91],
+    # Board.print, ...) keeps working.  `zobrist` is the state's Zobrist
+    # key, which Board.next_state updates incrementally.
+    #
+    # Move generation reads three more fields, which next_state also
+    # keeps up to date instead of rederiving them: `open` is the 9-bit
+    # mask of sub-boards still in play, `empty` the empty cells in the
+    # same layout as p1/p2, and `free` the number of empty cells in open
+    # sub-boards.  They are computed from the rest if not given.
+    __slots__ = ('p1', 'p2', 'meta1', 'meta2', 'drawn', 'player', 'last', 'zobrist',
+                 'open', 'empty', 'free')
+
+    def __init__(self, p1, p2, meta1, meta2, drawn, player, last, zobrist,
+                 open=None, empty=None, free=None):
+        self.p1 = p1
+        self.p2 = p2
+        self.meta1 = meta1
+        self.meta2 = meta2
+        self.drawn = drawn
+        self.player = player
+        self.last = last
+        self.zobrist = zobrist
+        if open is None:
+            open = ~(meta1 | meta2 | drawn) & FULL
+            empty = ~(p1 | p2) & ALL_CELLS
+            free = sum(POPCOUNT[(empty >> (q * 9)) & FULL] for q in CELLS[open])
+        self.open = open
+        self.empty = empty
+        self.free = free
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += 92
+        if i < 81:
+            if self.p1 >> i & 1:
+                return 1
+            if self.p2 >> i & 1:
+                return 2
+            return -1
+        if i < 90:
+            q = i - 81
+            if self.meta1 >> q & 1:
+                return 1
+            if self.meta2 >> q & 1:
+                return 2
+            if self.drawn >> q & 1:
+                return 0
+            return -1
+        if i == 90:
+            return self.player
+        if i == 91:
+            return self.last
+        raise IndexError('state index out of range')
+
+    def __len__(self):
+        return 92
+
+    def __iter__(self):
+        for i in range(92):
+            yield self[i]
+
+    def __eq__(self, other):
+        if not isinstance(other, BitState):
+            return NotImplemented
+        return (self.p1 == other.p1 and self.p2 == other.p2 and
+                self.player == other.player and self.last == other.last)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return self.zobrist
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return 'BitState({})'.format(tuple(self))
+
+
+class Board(object):
+    # Bitboard implementation of ultimatetictactoe_online.Board.  It has
+    # the same public API and the same rules, but states are BitState
+    # objects and win detection is a lookup in WIN_TABLE.
+    def start(self):
+        # Returns a representation of the starting state of the game.
+        self.starting_player = randint(0,1)+1
+        key = ZOBRIST_LAST[0] ^ (ZOBRIST_SIDE if self.starting_player == 2 else 0)
+        return BitState(0, 0, 0, 0, 0, self.starting_player, -1, key, FULL, ALL_CELLS, 81)
+
+    def current_player(self, state):
+        # Takes the game state and returns the current player's
+        # number.
+        return state.player
+
+    def next_state(self, state, play):
+        # Takes the game state, and the move to be applied.
+        # Returns the new game state.
+        p1, p2 = state.p1, state.p2
+        meta1, meta2, drawn = state.meta1, state.meta2, state.drawn
+        open_quadrants, free = state.open, state.free
+        empty = state.empty & ~(1 << play)
+        quadrant = play // 9
+        shift = quadrant * 9
+        bit = 1 << quadrant
+        key = (state.zobrist ^ ZOBRIST_CELLS[state.player][play] ^ ZOBRIST_SIDE ^
+               ZOBRIST_LAST[state.last + 1] ^ ZOBRIST_LAST[play + 1])
+        closed = False
+        if state.player == 1:
+            p1 |= 1 << play
+            if WIN_TABLE[(p1 >> shift) & FULL]:
+                meta1 |= bit
+                closed = True
+            player = 2
+        else:
+            p2 |= 1 << play
+            if WIN_TABLE[(p2 >> shift) & FULL]:
+                meta2 |= bit
+                closed = True
+            player = 1
+
+        # A full sub-board counts as drawn, even if the last mark won it.
+        remaining = (empty >> shift) & FULL
+        if not remaining:
+            meta1 &= ~bit
+            meta2 &= ~bit
+            drawn |= bit
+            closed = True
+
+        if open_quadrants & bit:
+            free -= 1
+            if closed:
+                open_quadrants &= ~bit
+                free -= POPCOUNT[remaining]
+
+        return BitState(p1, p2, meta1, meta2, drawn, player, play, key, open_quadrants, empty, free)
+
+    def _forced(self, state):
+        # Returns the sub-board the player to move must play in, or -1
+        # if they may play in any open one.
+        if state.last != -1:
+            quadrant = state.last % 9
+            if state.open & BIT[quadrant]:
+                return quadrant
+        return -1
+
+    def legal_plays(self, state_history):
+        # Takes a sequence of game states representing the full
+        # game history, and returns the full list of moves that
+        # are legal plays for the current player.
+        state = state_history[-1]
+        empty = state.empty
+        quadrant = self._forced(state)
+        if quadrant != -1:
+            return list(QUADRANT_MOVES[quadrant][(empty >> (quadrant * 9)) & FULL])
+
+        legal_moves = []
+        for quadrant in CELLS[state.open]:
+            legal_moves.extend(QUADRANT_MOVES[quadrant][(empty >> (quadrant * 9)) & FULL])
+        return legal_moves
+
+    def legal_count(self, state_history):
+        # Returns the number of legal plays, without listing them.
+        state = state_history[-1]
+        quadrant = self._forced(state)
+        if quadrant != -1:
+            return POPCOUNT[(state.empty >> (quadrant * 9)) & FULL]
+        return state.free
+
+    def random_play(self, state_history):
+        # Returns a uniformly random legal play without listing them
+        # all, or -1 if there are no legal plays.
+        state = state_history[-1]
+        empty = state.empty
+        quadrant = self._forced(state)
+        if quadrant != -1:
+            cells = CELLS[(empty >> (quadrant * 9)) & FULL]
+            return quadrant * 9 + cells[int(random() * len(cells))]
+
+        if not state.free:
+            return -1
+        r = int(random() * state.free)
+        for quadrant in CELLS[state.open]:
+            cells = CELLS[(empty >> (quadrant * 9)) & FULL]
+            if r < len(cells):
+                return quadrant * 9 + cells[r]
+            r -= len(cells)
+
+    def winner(self, state_history):
+        state = state_history[-1]
+        if WIN_TABLE[state.meta1]:
+            return 1
+        if WIN_TABLE[state.meta2]:
+            return 2
+        return 0
+
+    def forced(self, state_history):
+        # Returns -1 if neither player can still complete a line of the
+        # meta-board, so the game must end in a draw, the player who is
+        # the only one who still can, or 0 if both can.
+        state = state_history[-1]
+        live1 = LIVE_TABLE[state.meta2 | state.drawn]
+        live2 = LIVE_TABLE[state.meta1 | state.drawn]
+        if live1:
+            return 0 if live2 else 1
+        return 2 if live2 else -1
+
+    def sub_winner(self, state):
+        # Takes a sequence of 9 cell values and returns the player who
+        # has a line in it, or zero.
+        mask1 = 0
+        mask2 = 0
+        for i, x in enumerate(state[:9]):
+            if x == 1:
+                mask1 |= 1 << i
+            elif x == 2:
+                mask2 |= 1 << i
+        if WIN_TABLE[mask1]:
+            return 1
+        if WIN_TABLE[mask2]:
+            return 2
+        return 0
+
+    def from_tuple(self, state):
+        # Converts a 92-element tuple state into a BitState.
+        p1 = p2 = meta1 = meta2 = drawn = 0
+        for i in range(81):
+            if state[i] == 1:
+                p1 |= 1 << i
+            elif state[i] == 2:
+                p2 |= 1 << i
+        for q in range(9):
+            if state[81+q] == 1:
+                meta1 |= 1 << q
+            elif state[81+q] == 2:
+                meta2 |= 1 << q
+            elif state[81+q] == 0:
+                drawn |= 1 << q
+        return BitState(p1, p2, meta1, meta2, drawn, state[90], state[91], zobrist(state))
+
+    def to_tuple(self, state):
+        # Converts a BitState into the 92-element tuple format.
+        return tuple(state)
+
+    def print(self, state):
+        for start in [0, 3, 6, 27, 30, 33, 54, 57, 60]:
+            row = ""
+            for x in [start+x for x in [0, 1, 2, 9, 10, 11, 18, 19, 20]]:
+                row += '-' if state[x] == -1 else str(state[x])
+            print(row)
+        print()
+        for start in [x+81 for x in [0, 3, 6]]:
+            row = ""
+            for x in [start+x for x in [0, 1, 2, ]]:
+                row += '-' if state[x] == -1 else str(state[x])
+            print(row)
+        print()
+
+
+class Position(object):
+    # A mutable game position for search and playouts.  Moves are
+    # applied in place with play() and taken back with undo(), and the
+    # legal-move and winner queries read the position directly instead
+    # of a state history.  All storage is allocated up front, so
+    # playing and undoing moves does not build any tuples or lists.
+    # `zobrist` is kept up to date with the same keys as BitState.
+    __slots__ = ('masks', 'meta', 'drawn', 'player', 'last', 'ply', 'zobrist',
+                 '_moves', '_lasts', '_metas', '_drawns')
+
+    def __init__(self, state=None):
+        # masks[player][quadrant] and meta[player] are indexed by the
+        # player number, so index 0 is unused.
+        self.masks = [None, [0] * 9, [0] * 9]
+        self.meta = [0, 0, 0]
+        self.drawn = 0
+        self.player = 1
+        self.last = -1
+        self.ply = 0
+        self.zobrist = 0
+        self._moves = [0] * 81
+        self._lasts = [0] * 81
+        self._metas = [0] * 81
+        self._drawns = [0] * 81
+        if state is not None:
+            self.set(state)
+
+    def set(self, state):
+        # Resets the position to a BitState or a 92-element tuple
+        # state, reusing the existing storage.
+        masks1, masks2 = self.masks[1], self.masks[2]
+        if isinstance(state, BitState):
+            p1, p2 = state.p1, state.p2
+            for q in range(9):
+                masks1[q] = (p1 >> (q * 9)) & FULL
+                masks2[q] = (p2 >> (q * 9)) & FULL
+            self.meta[1] = state.meta1
+            self.meta[2] = state.meta2
+            self.drawn = state.drawn
+            self.zobrist = state.zobrist
+        else:
+            meta1 = meta2 = drawn = 0
+            for q in range(9):
+                mask1 = mask2 = 0
+                for c in range(9):
+                    x = state[q * 9 + c]
+                    if x == 1:
+                        mask1 |= BIT[c]
+                    elif x == 2:
+                        mask2 |= BIT[c]
+                masks1[q] = mask1
+                masks2[q] = mask2
+                x = state[81 + q]
+                if x == 1:
+                    meta1 |= BIT[q]
+                elif x == 2:
+                    meta2 |= BIT[q]
+                elif x == 0:
+                    drawn |= BIT[q]
+            self.meta[1] = meta1
+            self.meta[2] = meta2
+            self.drawn = drawn
+            self.zobrist = zobrist(state)
+        self.player = state[90]
+        self.last = state[91]
+        self.ply = 0
+
+    def state(self):
+        # Returns the current position as an immutable BitState.
+        p1 = p2 = 0
+        masks1, masks2 = self.masks[1], self.masks[2]
+        for q in range(9):
+            p1 |= masks1[q] << (q * 9)
+            p2 |= masks2[q] << (q * 9)
+        return BitState(p1, p2, self.meta[1], self.meta[2], self.drawn, self.player, self.last, self.zobrist)
+
+    def play(self, move):
+        # Applies a move for the player to move.  Returns True if the
+        # move closed its sub-board, which is the only time winner() and
+        # forced() can change.
+        player = self.player
+        quadrant, cell = divmod(move, 9)
+        i = self.ply
+        self._moves[i] = move
+        self._lasts[i] = self.last
+        self._metas[i] = self.meta[player]
+        self._drawns[i] = self.drawn
+
+        mine = self.masks[player]
+        mask = mine[quadrant] | BIT[cell]
+        mine[quadrant] = mask
+        closed = False
+        if WIN_TABLE[mask]:
+            self.meta[player] |= BIT[quadrant]
+            closed = True
+        # A full sub-board counts as drawn, even if the last mark won it.
+        if mask | self.masks[3 - player][quadrant] == FULL:
+            self.meta[player] &= ~BIT[quadrant]
+            self.drawn |= BIT[quadrant]
+            closed = True
+
+        self.zobrist ^= (ZOBRIST_CELLS[player][move] ^ ZOBRIST_SIDE ^
+                         ZOBRIST_LAST[self.last + 1] ^ ZOBRIST_LAST[move + 1])
+        self.last = move
+        self.player = 3 - player
+        self.ply = i + 1
+        return closed
+
+    def undo(self):
+        # Takes back the last move applied with play().
+        i = self.ply - 1
+        player = 3 - self.player
+        quadrant, cell = divmod(self._moves[i], 9)
+        self.masks[player][quadrant] &= ~BIT[cell]
+        self.meta[player] = self._metas[i]
+        self.drawn = self._drawns[i]
+        self.zobrist ^= (ZOBRIST_CELLS[player][self.last] ^ ZOBRIST_SIDE ^
+                         ZOBRIST_LAST[self.last + 1] ^ ZOBRIST_LAST[self._lasts[i] + 1])
+        self.last = self._lasts[i]
+        self.player = player
+        self.ply = i
+
+    def _open(self):
+        # Returns a 9-bit mask of the sub-boards the player to move may
+        # play in.
+        closed = self.meta[1] | self.meta[2] | self.drawn
+        if self.last != -1:
+            quadrant = self.last % 9
+            if not closed & BIT[quadrant]:
+                return BIT[quadrant]
+        return ~closed & FULL
+
+    def legal_plays(self):
+        # Returns the list of legal moves for the player to move.
+        masks1, masks2 = self.masks[1], self.masks[2]
+        legal_moves = []
+        for quadrant in CELLS[self._open()]:
+            shift = quadrant * 9
+            legal_moves.extend(shift + c for c in CELLS[~(masks1[quadrant] | masks2[quadrant]) & FULL])
+        return legal_moves
+
+    def random_play(self):
+        # Returns a uniformly random legal move without building the
+        # move list, or -1 if there are no legal moves.
+        masks1, masks2 = self.masks[1], self.masks[2]
+        quadrants = CELLS[self._open()]
+        total = 0
+        for quadrant in quadrants:
+            total += POPCOUNT[~(masks1[quadrant] | masks2[quadrant]) & FULL]
+        if total == 0:
+            return -1
+        r = int(random() * total)
+        for quadrant in quadrants:
+            empty = ~(masks1[quadrant] | masks2[quadrant]) & FULL
+            if r < POPCOUNT[empty]:
+                return quadrant * 9 + CELLS[empty][r]
+            r -= POPCOUNT[empty]
+
+    def open_cells(self):
+        # Returns the number of empty cells left in sub-boards that are
+        # still open.
+        masks1, masks2 = self.masks[1], self.masks[2]
+        closed = self.meta[1] | self.meta[2] | self.drawn
+        return sum(POPCOUNT[~(masks1[quadrant] | masks2[quadrant]) & FULL] for quadrant in CELLS[~closed & FULL])
+
+    def winner(self):
+        # Returns the player who has won the meta-board, or zero.
+        if WIN_TABLE[self.meta[1]]:
+            return 1
+        if WIN_TABLE[self.meta[2]]:
+            return 2
+        return 0
+
+    def forced(self):
+        # Returns -1 if neither player can still complete a line of the
+        # meta-board, the player who is the only one who still can, or
+        # 0 if both can.
+        live1 = LIVE_TABLE[self.meta[2] | self.drawn]
+        live2 = LIVE_TABLE[self.meta[1] | self.drawn]
+        if live1:
+            return 0 if live2 else 1
+        return 2 if live2 else -1
+
+    def rollout(self, next_move=None, max_moves=81):
+        # Plays the moves returned by `next_move` (random_play if not
+        # given) in place until the game ends or `max_moves` have been
+        # made, and leaves the position where the playout stopped.
+        # Returns the winner, -1 for a draw, or 0 if the game didn't
+        # finish.
+        if next_move is None:
+            next_move = self.random_play
+        for _ in range(max_moves):
+            move = next_move()
+            if move == -1:
+                return -1
+            if self.play(move):
+                winner = self.winner()
+                if winner != 0:
+                    return winner
+                # Once neither player can complete a line of the
+                # meta-board the game can only be drawn.
+                if self.forced() == -1:
+                    return -1
+        return 0
+
+
+if __name__ == '__main__':
+    board = Board()
+    state = board.start()
+
+    for _ in range(81):
+        legal_plays = board.legal_plays([state])
+        if len(legal_plays) == 0:
+            break
+
+        play = choice(legal_plays)
+        state = board.next_state(state, play)
+
+        board.print(state)
+
+        if board.winner([state]):
+            print(board.winner([state]))
+            break
@@ -0,0 +1,145 @@
+import sys
+from operator import itemgetter
+
+PLAYS, WINS, DRAWS, LOSSES, USED = range(5)
+
+
+class BoundedView(object):
+    # One statistic of a BoundedTable, looked up by the same
+    # (player, state) keys as the dicts in MonteCarlo, so the table can
+    # be used in their place.
+    def __init__(self, table, field):
+        self.table = table
+        self.entries = table.entries
+        self.field = field
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key][self.field]
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        return entry[self.field]
+
+    def __setitem__(self, key, value):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.table.insert(key)
+        entry[self.field] = value
+        if self.field == PLAYS:
+            entry[USED] = self.table.clock
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class BoundedTable(object):
+    # Search statistics with a memory cap.  Entries are kept in a dict
+    # in the order they were added or last survived an eviction scan.
+    # Once the table is over its cap, every insert evicts entries from
+    # the front of that order, so the cost is spread over the search
+    # instead of spent in one long sweep.  Each scanned entry is
+    # evicted if:
+    #   - it can no longer be reached from the root set by set_root
+    #   - it has fewer than `min_visits` plays
+    #   - it hasn't been played through in the last `max_age` inserts
+    # Otherwise it goes to the back of the order.  Entries on the root
+    # path, set with protect(), are never evicted.  A scan looks at no
+    # more than `scan` entries; if none of them qualify, the least
+    # visited unprotected one goes.
+    #
+    # plays/wins/draws/losses are views that can stand in for the
+    # statistics dicts of MonteCarlo.
+    def __init__(self, max_bytes=256 * 1024 * 1024, min_visits=2, max_age=10000, scan=32):
+        self.max_bytes = max_bytes
+        self.min_visits = min_visits
+        self.max_age = max_age
+        self.scan = scan
+        self.entries = {}
+        self.entry_bytes = None
+        self.max_entries = None
+        self.clock = 0
+        self.evicted = 0
+        self.protected = set()
+        self.marks = None
+        self.root_marks = None
+
+        self.plays = BoundedView(self, PLAYS)
+        self.wins = BoundedView(self, WINS)
+        self.draws = BoundedView(self, DRAWS)
+        self.losses = BoundedView(self, LOSSES)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def nbytes(self):
+        # Returns the estimated memory held by the table.
+        return len(self.entries) * (self.entry_bytes or 0)
+
+    def protect(self, keys):
+        # Marks the keys on the path to the root as never evictable.
+        self.protected = set(keys)
+
+    def set_root(self, state):
+        # Entries whose marks disagree with `state` can't be reached
+        # from it any more, and are evicted first.
+        filled = [i for i in range(81) if state[i] != -1]
+        if filled:
+            self.marks = itemgetter(*filled)
+            self.root_marks = self.marks(state)
+        else:
+            self.marks = self.root_marks = None
+
+    def insert(self, key):
+        # Adds a zeroed entry for `key`, evicting others if the table is
+        # over its cap.  Returns the entry.
+        if self.entry_bytes is None:
+            # Dict slot, key tuple, state and entry list.
+            self.entry_bytes = (sys.getsizeof(key) + sys.getsizeof(key[1]) +
+                                sys.getsizeof([0] * 5) + 3 * 8 * 3)
+            self.max_entries = max(1, self.max_bytes // self.entry_bytes)
+
+        self.clock += 1
+        entry = [0, 0, 0, 0, self.clock]
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            if not self.evict(key):
+                break
+        return entry
+
+    def evict(self, keep=None):
+        # Evicts one entry other than `keep`.  Returns False if nothing
+        # can be evicted.
+        entries = self.entries
+        protected = self.protected
+        marks, root_marks = self.marks, self.root_marks
+        oldest = self.clock - self.max_age
+        fallback = None
+        for _ in range(min(self.scan, len(entries))):
+            key = next(iter(entries))
+            entry = entries.pop(key)
+            if key not in protected and key != keep:
+                if ((marks is not None and marks(key[1]) != root_marks) or
+                        entry[PLAYS] < self.min_visits or entry[USED] < oldest):
+                    if fallback is not None:
+                        entries[fallback[0]] = fallback[1]
+                    self.evicted += 1
+                    return True
+                if fallback is None or entry[PLAYS] < fallback[1][PLAYS]:
+                    if fallback is not None:
+                        entries[fallback[0]] = fallback[1]
+                    fallback = (key, entry)
+                    continue
+            entries[key] = entry
+
+        if fallback is None:
+            return False
+        self.evicted += 1
+        return True
@@ -0,0 +1,251 @@
+import json
+import argparse
+from math import exp
+
+from bitboard import Position, LINE_MASKS, CELLS, POPCOUNT, BIT, FULL
+from rolloutpolicy import WIN_CELLS
+from ultimatetictactoe_online import log
+
+# The features are computed for both players and given as player 1's
+# value minus player 2's, so a position and its colour-swapped mirror
+# get opposite values.
+FEATURES = (
+    'bias',
+    'side',             # +1 with player 1 to move, -1 with player 2
+    'free',             # the side to move may play in any sub-board (signed as `side`)
+    'centre',           # won centre sub-board
+    'corners',          # won corner sub-boards
+    'edges',            # won edge sub-boards
+    'lines1',           # live meta-board lines holding one won sub-board
+    'lines2',           # live meta-board lines holding two won sub-boards
+    'threats',          # open sub-boards with a winning cell (2 for more than one)
+    'live_threats',     # the same, counting only sub-boards on a live meta-board line
+)
+
+CENTRE = BIT[4]
+CORNERS = BIT[0] | BIT[2] | BIT[6] | BIT[8]
+EDGES = BIT[1] | BIT[3] | BIT[5] | BIT[7]
+
+# THREATS[own << 9 | theirs] is the number of empty cells, capped at 2,
+# that would win a sub-board for the player with marks `own`.
+THREATS = [min(POPCOUNT[cells], 2) for cells in WIN_CELLS]
+
+
+def _meta_table():
+    # META[own << 9 | blocked] is (lines1, lines2, live) for a player who
+    # has won the sub-boards `own` of the meta-board and can't use the
+    # sub-boards `blocked` (won by the opponent or drawn): the number of
+    # lines still open to them holding one and two of their sub-boards,
+    # and the mask of sub-boards on some line still open to them.  The
+    # tuples are shared, so the table is no bigger than a list of ints.
+    table = [None] * (1 << 18)
+    shared = {}
+    for own in range(512):
+        free = ~own & FULL
+        blocked = free
+        while True:
+            lines1 = lines2 = live = 0
+            for line in LINE_MASKS:
+                if not line & blocked:
+                    live |= line
+                    count = POPCOUNT[line & own]
+                    if count == 1:
+                        lines1 += 1
+                    elif count == 2:
+                        lines2 += 1
+            entry = (lines1, lines2, live)
+            table[own << 9 | blocked] = shared.setdefault(entry, entry)
+            if not blocked:
+                break
+            blocked = (blocked - 1) & free
+    return table
+
+
+META = _meta_table()
+
+# Weights fitted with `python evaluator.py --method logistic` on 400
+# self-play games of montecarlo_tree at 0.02 seconds a move.
+DEFAULT_WEIGHTS = [
+    -0.1794,
+    0.0485,
+    0.3835,
+    -0.1838,
+    0.1178,
+    0.1110,
+    0.2145,
+    0.7236,
+    0.1162,
+    0.0908,
+]
+DEFAULT_LINK = 'logistic'
+
+
+def features(position):
+    # Returns the feature vector of a bitboard.Position, in the order
+    # of FEATURES.
+    masks1, masks2 = position.masks[1], position.masks[2]
+    meta1, meta2, drawn = position.meta[1], position.meta[2], position.drawn
+    lines1_1, lines2_1, live1 = META[meta1 << 9 | meta2 | drawn]
+    lines1_2, lines2_2, live2 = META[meta2 << 9 | meta1 | drawn]
+    closed = meta1 | meta2 | drawn
+
+    threats = live_threats = 0
+    for q in CELLS[~closed & FULL]:
+        m1, m2 = masks1[q], masks2[q]
+        t1 = THREATS[m1 << 9 | m2]
+        t2 = THREATS[m2 << 9 | m1]
+        threats += t1 - t2
+        if live1 & BIT[q]:
+            live_threats += t1
+        if live2 & BIT[q]:
+            live_threats -= t2
+
+    side = 1 if position.player == 1 else -1
+    last = position.last
+    free = side if last == -1 or closed & BIT[last % 9] else 0
+    return [
+        1,
+        side,
+        free,
+        POPCOUNT[meta1 & CENTRE] - POPCOUNT[meta2 & CENTRE],
+        POPCOUNT[meta1 & CORNERS] - POPCOUNT[meta2 & CORNERS],
+        POPCOUNT[meta1 & EDGES] - POPCOUNT[meta2 & EDGES],
+        lines1_1 - lines1_2,
+        lines2_1 - lines2_2,
+        threats,
+        live_threats,
+    ]
+
+
+class Evaluator(object):
+    # A linear value function over features().  evaluate() returns
+    # player 1's expected score in a position, 1 for a win, 0.5 for a
+    # draw and 0 for a loss.  With link='logistic' the weighted sum is
+    # squashed with the logistic function; with link='linear' it is a
+    # direct estimate of the score on a -1 to 1 scale, clipped.
+    def __init__(self, weights=None, link=None):
+        if weights is None:
+            weights, link = DEFAULT_WEIGHTS, DEFAULT_LINK
+        if len(weights) != len(FEATURES):
+            raise ValueError('expected {} weights, got {}'.format(len(FEATURES), len(weights)))
+        self.weights = [float(w) for w in weights]
+        self.link = link or 'logistic'
+
+    def value(self, position):
+        # Returns the weighted sum of the features of `position`.
+        return sum(w * x for w, x in zip(self.weights, features(position)))
+
+    def evaluate(self, position):
+        z = self.value(position)
+        if self.link == 'logistic':
+            if z < -30:
+                return 0.0
+            return 1.0 / (1.0 + exp(-z))
+        return 0.5 + 0.5 * max(-1.0, min(1.0, z))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'features': FEATURES, 'weights': self.weights, 'link': self.link}, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if list(data['features']) != list(FEATURES):
+            raise ValueError('{} was fitted on different features'.format(path))
+        return cls(data['weights'], data['link'])
+
+
+def feature_matrix(states):
+    # Returns the features of a sequence of states (92-element tuples or
+    # rows of a NumPy array) as a float64 array with one row per state.
+    import numpy as np
+    position = Position()
+    rows = []
+    for state in states:
+        position.set(tuple(int(x) for x in state))
+        rows.append(features(position))
+    return np.array(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+
+
+def fit(X, scores, method='logistic', l2=1e-3, iterations=30):
+    # Fits weights to feature rows `X` and player 1's scores (0, 0.5 or
+    # 1) by least squares on a -1 to 1 scale (method='lstsq') or by
+    # logistic regression with Newton's method (method='logistic').  A
+    # small L2 penalty keeps rarely seen features from blowing up.
+    # Returns an Evaluator.
+    import numpy as np
+    n, k = X.shape
+    penalty = l2 * n * np.eye(k)
+    penalty[0, 0] = 0
+    if method == 'lstsq':
+        y = 2 * scores - 1
+        weights = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+        return Evaluator(weights.tolist(), 'linear')
+    if method != 'logistic':
+        raise ValueError('unknown method {!r}'.format(method))
+    weights = np.zeros(k)
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(X @ weights)))
+        gradient = X.T @ (p - scores) + penalty @ weights
+        hessian = (X * (p * (1 - p))[:, None]).T @ X + penalty
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return Evaluator(weights.tolist(), 'logistic')
+
+
+def scores(winners):
+    # Maps recorded winners (1, 2, or 0 for a draw) to player 1's score.
+    import numpy as np
+    winners = np.asarray(winners)
+    return np.where(winners == 1, 1.0, np.where(winners == 2, 0.0, 0.5))
+
+
+def report(evaluator, X, y):
+    # Returns (mean squared error, accuracy) of `evaluator` on feature
+    # rows `X` with scores `y`; decided games count as correct when the
+    # predicted score is on the winner's side of 0.5.
+    import numpy as np
+    z = X @ np.array(evaluator.weights)
+    if evaluator.link == 'logistic':
+        predicted = 1 / (1 + np.exp(-z))
+    else:
+        predicted = 0.5 + 0.5 * np.clip(z, -1, 1)
+    decided = y != 0.5
+    accuracy = float(((predicted > 0.5) == (y > 0.5))[decided].mean()) if decided.any() else 0.0
+    return float(((predicted - y) ** 2).mean()), accuracy
+
+
+def train(paths, method='logistic', holdout=10):
+    # Fits an Evaluator to the self-play shards in `paths` (see
+    # selfplay.py).  Every `holdout`th game is kept out of the fit and
+    # used to report how well the weights generalise.  Returns the
+    # Evaluator.
+    from selfplay import load
+    records = load(paths)
+    X = feature_matrix(records['state'])
+    y = scores(records['winner'])
+    test = records['game'] % holdout == 0
+    evaluator = fit(X[~test], y[~test], method)
+    log('positions: {} train: {} test: {}'.format(len(y), int((~test).sum()), int(test.sum())))
+    for name, rows in (('train', ~test), ('test', test)):
+        if rows.any():
+            mse, accuracy = report(evaluator, X[rows], y[rows])
+            log('{} mse: {:.4f} accuracy: {:.3f}'.format(name, mse, accuracy))
+    return evaluator
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the evaluator to self-play games.')
+    parser.add_argument('shards', nargs='+', help='self-play shard files')
+    parser.add_argument('--method', choices=('logistic', 'lstsq'), default='logistic')
+    parser.add_argument('--output', help='file to save the weights to')
+    args = parser.parse_args()
+
+    evaluator = train(args.shards, args.method)
+    for name, weight in zip(FEATURES, evaluator.weights):
+        log('{:>14}: {:+.4f}'.format(name, weight))
+    if args.output:
+        evaluator.save(args.output)
@@ -0,0 +1,211 @@
+import os
+import mmap
+import struct
+import argparse
+
+from ultimatetictactoe_online import Board, log
+
+# A packed state is 24 bytes holding a 192-bit little-endian integer.
+# Each of the 90 cells and meta cells of the 92-element tuple state takes
+# two bits, index i at bits 2*i and 2*i+1, coded as the cell's value & 3:
+# 3 for -1 (empty or still open), 0 for a drawn sub-board, and 1 or 2
+# for the player.  The player to move follows at bits 180-181 with the
+# same code, and the last move plus one (0 before the first move) at
+# bits 182-188.
+PACKED_SIZE = 24
+
+_CELLS = struct.Struct('90b')
+
+# bytes.translate tables between the signed bytes of the tuple values
+# and the 2-bit codes.
+_TO_CODES = bytes(i & 3 for i in range(256))
+_FROM_CODES = bytes([0, 1, 2, 255]) + bytes(252)
+
+# The 90 codes are packed by squeezing one code per byte into two bits
+# per code: each step halves the gap between neighbouring codes by
+# folding the upper half of every lane onto the lower half, and
+# unpacked by the same steps in reverse.  _STEPS holds (shift, packed
+# mask, spread mask) for lanes of 16, 32, ... 1024 bits, which covers
+# 90 bytes.
+_WIDTH = 1024
+
+
+def _lane_mask(lane, bits, offsets):
+    # Returns a _WIDTH-bit mask selecting `bits` bits at each of
+    # `offsets` within every `lane`-bit lane.
+    chunk = (1 << bits) - 1
+    mask = 0
+    for start in range(0, _WIDTH, lane):
+        for offset in offsets:
+            mask |= chunk << (start + offset)
+    return mask
+
+
+_STEPS = [(3 * lane // 8, _lane_mask(lane, lane // 4, [0]), _lane_mask(lane, lane // 8, [0, lane // 2]))
+          for lane in (16, 32, 64, 128, 256, 512, 1024)]
+
+_CODES_MASK = (1 << 180) - 1
+
+
+def pack(state):
+    # Returns the 24-byte packed form of a 92-element tuple state (or
+    # any sequence of its values, such as a bitboard.BitState).
+    if not isinstance(state, tuple):
+        state = tuple(state)
+    x = int.from_bytes(_CELLS.pack(*state[:90]).translate(_TO_CODES), 'little')
+    for shift, packed, _ in _STEPS:
+        x = (x | x >> shift) & packed
+    x |= (state[90] & 3) << 180 | (state[91] + 1) << 182
+    return x.to_bytes(PACKED_SIZE, 'little')
+
+
+def unpack(data):
+    # Returns the 92-element tuple state packed in `data`.
+    n = int.from_bytes(data, 'little')
+    x = n & _CODES_MASK
+    for shift, _, spread in reversed(_STEPS):
+        x = (x | x << shift) & spread
+    cells = _CELLS.unpack(x.to_bytes(90, 'little').translate(_FROM_CODES))
+    return cells + (n >> 180 & 3, (n >> 182 & 127) - 1)
+
+
+# A record file is a 32-byte header (MAGIC, the record size, padding)
+# followed by one fixed-size record per position, so the records can be
+# viewed in place as an array: the packed state, the game's number, the
+# position's ply within the game, the move played from it (-1 for the
+# final position) and the game's winner (1 or 2, 0 for a draw).  The
+# positions of a game are stored in order, one game after another.
+MAGIC = b'UTTTGAME'
+HEADER = struct.Struct('<8sI20x')
+RECORD = struct.Struct('<24sIHbb')
+
+
+def record_dtype():
+    # Returns the NumPy structured dtype of a record.
+    import numpy as np
+    return np.dtype([('state', 'u1', PACKED_SIZE), ('game', '<u4'), ('ply', '<u2'),
+                     ('move', 'i1'), ('winner', 'i1')])
+
+
+class RecordWriter(object):
+    # Appends games to a record file, creating it if needed.
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            check_header(path)
+        self.file = open(path, 'ab')
+        if not exists:
+            self.file.write(HEADER.pack(MAGIC, RECORD.size))
+        # New games are numbered on from the last game in the file.
+        self.games = 0
+        if os.path.getsize(path) > HEADER.size:
+            with open(path, 'rb') as f:
+                f.seek(HEADER.size + ((os.path.getsize(path) - HEADER.size) // RECORD.size - 1) * RECORD.size)
+                self.games = RECORD.unpack(f.read(RECORD.size))[1] + 1
+
+    def write_game(self, states, winner):
+        # Writes one game, given as the list of its states from the
+        # first to the last, and its winner (1, 2, or 0 for a draw).
+        # Returns the game's number.
+        game = self.games
+        records = []
+        for ply, state in enumerate(states):
+            move = states[ply + 1][91] if ply + 1 < len(states) else -1
+            records.append(RECORD.pack(pack(state), game, ply, move, winner))
+        self.file.write(b''.join(records))
+        self.games += 1
+        return game
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_header(path):
+    with open(path, 'rb') as f:
+        magic, size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError('{} is not a game record file'.format(path))
+
+
+def open_records(path):
+    # Maps the record file at `path` into memory and returns its records
+    # as a read-only NumPy structured array (see record_dtype) backed
+    # directly by the mapping, so nothing is read until it is used.
+    import numpy as np
+    check_header(path)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    count = (len(data) - HEADER.size) // RECORD.size
+    return np.frombuffer(data, record_dtype(), count, HEADER.size)
+
+
+def unpack_array(packed):
+    # Unpacks an (n, 24) uint8 array of packed states, such as
+    # open_records(path)['state'], into an (n, 92) int8 array of tuple
+    # states in one pass.
+    import numpy as np
+    packed = np.asarray(packed, dtype=np.uint8).reshape(-1, PACKED_SIZE)
+    codes = (packed[:, :, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    states = codes.reshape(len(packed), 4 * PACKED_SIZE)[:, :92].astype(np.int8)
+    cells = states[:, :90]
+    cells[cells == 3] = -1
+    states[:, 91] = ((packed[:, 22] >> 6) | (packed[:, 23] & 31) << 2).astype(np.int8) - 1
+    return states
+
+
+def read_games(path):
+    # Yields (game, winner, states, moves) for every game of a record
+    # file, with the states unpacked to tuples.
+    records = open_records(path)
+    if not len(records):
+        return
+    starts = [0] + [i for i in range(1, len(records)) if records['game'][i] != records['game'][i - 1]]
+    starts.append(len(records))
+    for begin, end in zip(starts, starts[1:]):
+        rows = records[begin:end]
+        states = [unpack(row.tobytes()) for row in rows['state']]
+        yield int(rows['game'][0]), int(rows['winner'][0]), states, [int(m) for m in rows['move'][:-1]]
+
+
+def convert(shards, path):
+    # Appends the games of selfplay.py shards to the record file at
+    # `path`.  A shard holds the positions moves were played from, so
+    # each game's final position is rebuilt from its last move.
+    # Returns the number of positions written.
+    from selfplay import read_shard
+    board = Board()
+    positions = 0
+    with RecordWriter(path) as writer:
+        for shard in shards:
+            states = []
+            game = winner = move = None
+            for state, visits, record_move, record_winner, record_game in read_shard(shard):
+                if record_game != game and states:
+                    states.append(board.next_state(states[-1], move))
+                    writer.write_game(states, winner)
+                    positions += len(states)
+                    states = []
+                states.append(state)
+                game, winner, move = record_game, record_winner, record_move
+            if states:
+                states.append(board.next_state(states[-1], move))
+                writer.write_game(states, winner)
+                positions += len(states)
+    return positions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert self-play shards to a game record file.')
+    parser.add_argument('output', help='record file to append to')
+    parser.add_argument('shards', nargs='+', help='self-play shard files')
+    args = parser.parse_args()
+
+    positions = convert(args.shards, args.output)
+    log('positions: {} bytes: {}'.format(positions, os.path.getsize(args.output)))
@@ -0,0 +1,306 @@
+import sys
+from math import sqrt
+from math import log as math_log
+from random import choice
+from array import array
+import datetime
+from functools import partial
+
+from bitboard import Position
+from timemanager import TimeManager
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Nodes with at least this many children are selected through with
+# NumPy when it is available; below it the per-call overhead of NumPy
+# costs more than the plain loop.
+VECTOR_MIN = 40
+
+
+class NodeStore(object):
+    # A search tree stored as parallel typed arrays indexed by node id,
+    # so a node costs a few dozen bytes instead of a Python object and
+    # its state.  Node 0 is the root.  The children of a node are stored
+    # next to each other from first_child[node] on, child_count[node] is
+    # -1 until the node has been expanded, and parent[node] is the node
+    # it was expanded from.  `player` is the player who moved into the
+    # node, and wins/losses/draws are counted from that player's point
+    # of view.  The arrays start with room for `capacity` nodes and
+    # double whenever they fill up, up to `max_nodes`.
+    FIELDS = (('plays', 'i'), ('wins', 'i'), ('losses', 'i'), ('draws', 'i'),
+              ('first_child', 'i'), ('parent', 'i'), ('child_count', 'b'),
+              ('move', 'b'), ('player', 'b'))
+
+    def __init__(self, capacity=1 << 16, max_nodes=None):
+        self.capacity = 0
+        self.max_nodes = max_nodes
+        self.size = 0
+        for field, typecode in self.FIELDS:
+            setattr(self, field, array(typecode))
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        # Returns the bytes allocated to the arrays.
+        return sum(getattr(self, field).itemsize for field, typecode in self.FIELDS) * self.capacity
+
+    def grow(self, capacity):
+        # Extends every array to hold `capacity` nodes.
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return
+        for field, typecode in self.FIELDS:
+            getattr(self, field).extend(array(typecode, bytes(extra * array(typecode).itemsize)))
+        self.capacity = capacity
+
+    def reset(self, player):
+        # Empties the tree, leaving an unexpanded root that `player`
+        # moved into.
+        self.size = 0
+        self.add(-1, -1, player)
+
+    def add(self, parent, move, player):
+        # Allocates one node and returns its id.
+        node = self.size
+        self.plays[node] = self.wins[node] = self.losses[node] = self.draws[node] = 0
+        self.first_child[node] = 0
+        self.parent[node] = parent
+        self.child_count[node] = -1
+        self.move[node] = move
+        self.player[node] = player
+        self.size = node + 1
+        return node
+
+    def expand(self, node, moves, player):
+        # Allocates one child of `node` per move in `moves`.  Returns
+        # False if the tree is full.
+        first = self.size
+        needed = first + len(moves)
+        if self.max_nodes is not None and needed > self.max_nodes:
+            return False
+        if needed > self.capacity:
+            capacity = self.capacity
+            while capacity < needed:
+                capacity *= 2
+            if self.max_nodes is not None:
+                capacity = min(capacity, self.max_nodes)
+            self.grow(capacity)
+        for move in moves:
+            self.add(node, move, player)
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+        return True
+
+    def select(self, node, C, draws_multi):
+        # Picks the child of `node` to descend into: a random unvisited
+        # child if there is one, otherwise the child with the highest
+        # UCB value.
+        first = self.first_child[node]
+        count = self.child_count[node]
+        if np is not None and count >= VECTOR_MIN:
+            return first + self.select_vectorised(first, count, C, draws_multi)
+
+        plays, wins, losses, draws = self.plays, self.wins, self.losses, self.draws
+        children = range(first, first + count)
+        unvisited = [child for child in children if not plays[child]]
+        if unvisited:
+            return choice(unvisited)
+
+        log_total = math_log(sum(plays[first:first + count]))
+        best_value = -1
+        best = first
+        for child in children:
+            visits = wins[child] + losses[child] + (draws_multi * draws[child]) or plays[child]
+            value = (wins[child] / visits) + C * sqrt(log_total / visits)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def select_vectorised(self, first, count, C, draws_multi):
+        # select for children first..first+count, computed over NumPy
+        # views of the arrays.  Returns the offset of the chosen child.
+        plays = np.frombuffer(self.plays, np.int32, count, first * 4)
+        unvisited = np.flatnonzero(plays == 0)
+        if len(unvisited):
+            return int(choice(unvisited))
+
+        wins = np.frombuffer(self.wins, np.int32, count, first * 4)
+        visits = (wins + np.frombuffer(self.losses, np.int32, count, first * 4) +
+                  draws_multi * np.frombuffer(self.draws, np.int32, count, first * 4))
+        visits = np.where(visits > 0, visits, plays)
+        values = wins / visits + C * np.sqrt(math_log(plays.sum()) / visits)
+        return int(values.argmax())
+
+
+class MonteCarlo(object):
+    def __init__(self, board, **kwargs):
+        # Takes an instance of a Board and optionally some keyword
+        # arguments.  Initializes the list of game states and the node
+        # store.  Nodes don't keep their states: each simulation plays
+        # the moves on the way down on a bitboard.Position and takes
+        # them back before the next one.
+        self.silent = kwargs.get('silent', False)
+        self.board = board
+        self.states = []
+        seconds = kwargs.get('time', 0.08)
+        # A timemanager.TimeManager decides when each search stops; the
+        # default gives every move `time` seconds.
+        self.time_manager = kwargs.get('time_manager') or TimeManager(seconds)
+        self.max_games_simulated = 10000
+        self.max_moves = kwargs.get('max_moves', 81)
+        self.draws_multi = 0.1
+        self.C = kwargs.get('C', 5)
+        self.tree = NodeStore(kwargs.get('capacity', 1 << 16), kwargs.get('nodes'))
+        self.position = Position()
+        # With policy='tables', playouts on the Position pick their moves
+        # with rolloutpolicy.policy_play instead of uniformly at random.
+        self.policy = kwargs.get('policy', 'uniform')
+        if self.policy == 'tables':
+            from rolloutpolicy import policy_play
+            self.next_move = partial(policy_play, self.position)
+        elif self.policy == 'uniform':
+            self.next_move = self.position.random_play
+        else:
+            raise ValueError('unknown rollout policy {!r}'.format(self.policy))
+        self.root_state = None
+        self.max_depth = 0
+
+    def update(self, state):
+        # Takes a game state, and appends it to the history.
+        self.states.append(state)
+
+    def get_play(self):
+        # Causes the AI to calculate the best move from the
+        # current game state and return it.
+        self.max_depth = 0
+        state = self.states[-1]
+        legal = self.board.legal_plays(self.states[:])
+
+        # Bail out early if there is no real choice to be made.
+        if not legal:
+            return
+        if len(legal) == 1:
+            return legal[0]
+
+        begin = datetime.datetime.utcnow()
+        games = self.search(state)
+        stats = self.root_stats()
+
+        if not self.silent:
+            log('games: {} time: {}'.format(games, datetime.datetime.utcnow() - begin))
+            log('nodes: {} bytes: {}'.format(len(self.tree), self.tree.nbytes()))
+
+        # Pick the move with the highest percentage of wins.
+        percent_wins, move = max(
+            (wins / (0.1 + wins + losses + (self.draws_multi * draws)), p)
+            for p, (plays, wins, losses, draws) in stats.items()
+        )
+
+        if not self.silent:
+            for p, (plays, wins, losses, draws) in sorted(stats.items(), key=lambda item: -item[1][0]):
+                log('{}: {} plays ({} / {})'.format(p, plays, wins, losses))
+            log("Maximum depth searched: {}".format(self.max_depth))
+        return move
+
+    def search(self, state):
+        # Runs simulations from `state` until the time or game budget
+        # is used up.  Returns the number of simulations run.
+        self.set_root(state)
+        time_manager = self.time_manager
+        time_manager.start(state)
+        games = 0
+        while games < self.max_games_simulated and not time_manager.should_stop(games, self.leaders):
+            self.run_simulation()
+            games += 1
+        time_manager.finish()
+        return games
+
+    def set_root(self, state):
+        # Starts a new tree at `state`.
+        self.root_state = state
+        self.tree.reset(3 - self.board.current_player(state))
+        self.position.set(state)
+
+    def leaders(self):
+        # Returns the visit counts of the two most visited root moves.
+        visits = sorted(plays for plays, wins, losses, draws in self.root_stats().values())
+        return (visits[-1] if visits else 0), (visits[-2] if len(visits) > 1 else 0)
+
+    def root_stats(self):
+        # Returns {move: (plays, wins, losses, draws)} for the children
+        # of the root.
+        tree = self.tree
+        first = tree.first_child[0]
+        return dict(
+            (tree.move[child], (tree.plays[child], tree.wins[child], tree.losses[child], tree.draws[child]))
+            for child in range(first, first + max(tree.child_count[0], 0))
+        )
+
+    def run_simulation(self):
+        # Descends the tree to a node that has not been visited yet,
+        # plays out a random game from there and backs up the result
+        # along the parent links.
+        if self.root_state is not self.states[-1]:
+            self.set_root(self.states[-1])
+        tree = self.tree
+        position = self.position
+        # Take back the previous simulation's moves to get to the root.
+        while position.ply:
+            position.undo()
+        child_count, plays = tree.child_count, tree.plays
+        node = 0
+        winner = position.winner()
+
+        t = 0
+        while winner == 0:
+            if child_count[node] == -1 and not tree.expand(node, position.legal_plays(), position.player):
+                break
+            if child_count[node] == 0:
+                winner = -1
+                break
+
+            node = tree.select(node, self.C, self.draws_multi)
+            position.play(tree.move[node])
+            t += 1
+            winner = position.winner()
+            if plays[node] == 0:
+                break
+
+        if t > self.max_depth:
+            self.max_depth = t
+        if winner == 0:
+            winner = self.run_rollout(self.max_moves - t)
+        self.backpropagate(node, winner)
+
+    def backpropagate(self, node, winner):
+        # Adds the result of a simulation to `node` and its ancestors.
+        tree = self.tree
+        plays, wins, losses, draws = tree.plays, tree.wins, tree.losses, tree.draws
+        player, parent = tree.player, tree.parent
+        while node != -1:
+            plays[node] += 1
+            if winner > 0 and winner == player[node]:
+                wins[node] += 1
+            elif winner > 0:
+                losses[node] += 1
+            elif winner < 0:
+                draws[node] += 1
+            node = parent[node]
+
+    def run_rollout(self, max_moves):
+        # Plays random moves in place until the game ends.  Returns the
+        # winner, -1 for a draw, or 0 if the game didn't finish.
+        return self.position.rollout(self.next_move, max_moves)
+
+
+def log(message=None):
+    if message is None:
+        print(file=sys.stderr)
+    else:
+        print(str(message), file=sys.stderr)
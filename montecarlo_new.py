@@ -6,29 +6,50 @@ from math import sqrt
 from math import log as math_log
 from random import choice
 import datetime
+from time import perf_counter
 from copy import deepcopy
 
+from boundedtable import BoundedTable
+from searchengine import SearchEngine
+from searchstats import SearchStats
+from timemanager import TimeManager
+from ultimatetictactoe_online import playout
+
 random.seed(10)
 
 
-class MonteCarlo(object):
+class MonteCarlo(SearchEngine):
     def __init__(self, board, **kwargs):
         # Takes an instance of a Board and optionally some keyword
         # arguments.  Initializes the list of game states and the
         # statistics tables.
         self.silent = kwargs.get('silent', False)
-        self.board = board
+        self.init_board(board, kwargs)
         self.states = []
         seconds = kwargs.get('time', 0.08)
         self.calculation_time = datetime.timedelta(seconds=seconds)
+        # A timemanager.TimeManager decides when each search stops; the
+        # default gives every move `time` seconds.
+        self.time_manager = kwargs.get('time_manager') or TimeManager(seconds)
         self.max_games_simulated = 10000
-        self.max_moves = kwargs.get('max_moves', 100)
+        self.max_moves = kwargs.get('max_moves', 81)
         self.draws = {}
         self.draws_multi = 0.1
         self.wins = {}
         self.losses = {}
         self.plays = {}
         self.C = kwargs.get('C', 5)
+        # A transposition.TranspositionTable or boundedtable.BoundedTable
+        # can hold the statistics in place of the dicts; max_memory (in
+        # bytes) makes a BoundedTable with that cap.
+        table = kwargs.get('table')
+        if table is None and kwargs.get('max_memory'):
+            table = BoundedTable(kwargs['max_memory'])
+        self.table = table
+        if table is not None:
+            self.plays, self.wins, self.draws, self.losses = table.plays, table.wins, table.draws, table.losses
+        self.init_rollout(kwargs)
+        self.init_stats(kwargs)
 
     def update(self, state):
         # Takes a game state, and appends it to the history.
@@ -48,18 +69,45 @@ class MonteCarlo(object):
         if len(legal) == 1:
             return legal[0]
 
+        moves_states = [(p, self.board.next_state(state, p)) for p in legal]
+
+        def leaders():
+            # The visit counts of the two most visited root moves.
+            visits = sorted(self.plays.get((player, S), 0) for p, S in moves_states)
+            return visits[-1], visits[-2]
+
+        if self.collect_stats:
+            self.stats = SearchStats()
+
+        # Keep the path to the root and the root's children when the
+        # table has to evict.
+        table = self.table
+        if isinstance(table, BoundedTable):
+            table.set_root(state)
+            path = [(self.board.current_player(before), after)
+                    for before, after in zip(self.states, self.states[1:])]
+            table.protect(path + [(player, S) for p, S in moves_states])
+            evicted = table.evicted
+
         games = 0
         begin = datetime.datetime.utcnow()
-        while (datetime.datetime.utcnow() - begin < self.calculation_time) and (games < self.max_games_simulated):
+        time_manager = self.time_manager
+        time_manager.start(state)
+        while games < self.max_games_simulated and not time_manager.should_stop(games, leaders):
             self.run_simulation()
             games += 1
-
-        moves_states = [(p, self.board.next_state(state, p)) for p in legal]
+        time_manager.finish()
 
         # Display the number of calls of `run_simulation` and the
         # time elapsed.
         if not self.silent:
             log('games: {} time: {}'.format(games, datetime.datetime.utcnow() - begin))
+        if isinstance(table, BoundedTable):
+            evicted = table.evicted - evicted
+            if self.stats is not None:
+                self.stats.evictions = evicted
+            if not self.silent:
+                log('table: {} entries, {} evicted'.format(len(table), evicted))
 
         # Pick the move with the highest percentage of wins.
         percent_wins, move = max(
@@ -84,13 +132,31 @@ class MonteCarlo(object):
         if not self.silent:
             log("Maximum depth searched: {}".format(self.max_depth))
 
+        self.finish_stats(games, begin)
         return move
 
+    def table_size(self):
+        # Returns the number of entries in the statistics tables and
+        # roughly how many bytes they hold, including their keys.
+        table = getattr(self.plays, 'table', None)
+        if table is not None:
+            return len(table), table.nbytes()
+        size = sum(sys.getsizeof(d) for d in (self.plays, self.wins, self.draws, self.losses))
+        for key in self.plays:
+            size += sys.getsizeof(key) + sys.getsizeof(key[1])
+        return len(self.plays), size
+
     def run_simulation(self):
         # Plays out a "random" game from the current position,
         # then updates the statistics tables with the result.
         plays, wins, draws, losses = self.plays, self.wins, self.draws, self.losses
+        stats = self.stats
+        if stats is not None:
+            begin = expanded = perf_counter()
+            expansion = 0.0
+            expanded_at = 0
 
+        playout_board = self.playout_board
         visited_states = set()
         states_copy = self.states[:]
         state = states_copy[-1]
@@ -126,6 +192,8 @@ class MonteCarlo(object):
             # `player` here and below refers to the player
             # who moved into that particular state.
             if expand and (player, state) not in plays:
+                if stats is not None:
+                    expanding = perf_counter()
                 expand = False
                 plays[(player, state)] = 0
                 wins[(player, state)] = 0
@@ -133,6 +201,10 @@ class MonteCarlo(object):
                 losses[(player, state)] = 0
                 if t > self.max_depth:
                     self.max_depth = t
+                if stats is not None:
+                    expanded = perf_counter()
+                    expansion = expanded - expanding
+                    expanded_at = t
 
             visited_states.add((player, state))
 
@@ -141,6 +213,30 @@ class MonteCarlo(object):
             if winner != 0:
                 break
 
+            # Once the new node is expanded the rest of the game is a
+            # playout, which with rollout='position' doesn't need a
+            # state per ply.
+            if not expand:
+                if self.rollout == 'position':
+                    winner = self.run_rollout(state, self.max_moves - t)
+                else:
+                    winner = playout(playout_board, states_copy, self.max_moves - t)
+                break
+
+        if stats is not None:
+            backing_up = perf_counter()
+            if expanded_at:
+                stats.add_phase('selection', expanded - begin - expansion)
+                stats.add_phase('expansion', expansion)
+                stats.add_phase('rollout', backing_up - expanded)
+                stats.add_depth(expanded_at)
+                if self.rollout == 'position':
+                    stats.add_rollout(self.position.ply)
+                else:
+                    stats.add_rollout(len(states_copy) - len(self.states) - expanded_at)
+            else:
+                stats.add_phase('selection', backing_up - begin)
+
         for player, state in visited_states:
             if (player, state) not in plays:
                 continue
@@ -152,6 +248,16 @@ class MonteCarlo(object):
             elif winner < 0:
                 draws[(player, state)] += 1
 
+        if stats is not None:
+            stats.add_phase('backpropagation', perf_counter() - backing_up)
+
+    def run_rollout(self, state, max_moves):
+        # Plays random moves in place from `state` until the game ends or
+        # `max_moves` have been made.  Returns the winner, -1 for a
+        # draw, or 0 if the game didn't finish.
+        self.position.set(state)
+        return self.position.rollout(self.next_move, max_moves)
+
 
 def log(message=None):
     if message is None:
@@ -0,0 +1,328 @@
+import sys
+import random
+from math import sqrt
+from math import log as math_log
+import datetime
+from multiprocessing import Lock, Process, Queue
+from multiprocessing import shared_memory
+from queue import Empty
+from time import monotonic
+
+from bitboard import Position
+
+
+class SharedTree(object):
+    # A search tree stored as parallel int64 arrays in one block of
+    # shared memory, so several processes can descend it at once.
+    # Nodes are integer indexes and node 0 is the root.  The children
+    # of a node are stored next to each other from first_child[node]
+    # on; child_count[node] is -1 until the node has been expanded.
+    # `player` is the player who moved into the node, and wins/losses/
+    # draws are counted from that player's point of view.  `virtual`
+    # counts the simulations currently passing through the node.
+    FIELDS = ('plays', 'wins', 'losses', 'draws', 'virtual',
+              'first_child', 'child_count', 'move', 'player')
+
+    def __init__(self, capacity, name=None):
+        # Creates a tree with room for `capacity` nodes, or attaches
+        # to the existing tree called `name`.
+        self.capacity = capacity
+        size = 8 * (1 + capacity * len(self.FIELDS))
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        # header[0] is the number of nodes allocated so far.
+        self.header = buf[0:8].cast('q')
+        for i, field in enumerate(self.FIELDS):
+            start = 8 * (1 + i * capacity)
+            setattr(self, field, buf[start:start + 8 * capacity].cast('q'))
+
+    def reset(self, player):
+        # Empties the tree, leaving an unexpanded root that `player`
+        # moved into.
+        for field in self.FIELDS:
+            getattr(self, field)[0] = 0
+        self.child_count[0] = -1
+        self.move[0] = -1
+        self.player[0] = player
+        self.header[0] = 1
+
+    def expand(self, node, position):
+        # Allocates one child per legal move of `position`.  Must be
+        # called with the tree lock held.  Returns False if the tree is
+        # full.
+        moves = position.legal_plays()
+        first = self.header[0]
+        if first + len(moves) > self.capacity:
+            return False
+        player = position.player
+        plays, wins, losses, draws, virtual = self.plays, self.wins, self.losses, self.draws, self.virtual
+        for i, move in enumerate(moves):
+            child = first + i
+            plays[child] = wins[child] = losses[child] = draws[child] = virtual[child] = 0
+            self.child_count[child] = -1
+            self.move[child] = move
+            self.player[child] = player
+        self.first_child[node] = first
+        self.header[0] = first + len(moves)
+        self.child_count[node] = len(moves)
+        return True
+
+    def release(self):
+        # Drops this process's views of the shared block.
+        for field in self.FIELDS:
+            getattr(self, field).release()
+        self.header.release()
+        self.shm.close()
+
+
+class TreeSearch(object):
+    # Runs simulations on a SharedTree from one process.  Selection uses
+    # virtual loss: a simulation on its way through a node counts as a
+    # loss for it until it is backed up, so concurrent workers spread
+    # over different lines instead of all following the same one.
+    #
+    # The statistics are updated without locking.  An increment lost to
+    # a race between two workers only costs one simulation's result;
+    # expansion, which allocates nodes, is done under the lock.
+    def __init__(self, tree, lock, **kwargs):
+        self.tree = tree
+        self.lock = lock
+        self.max_moves = kwargs.get('max_moves', 81)
+        self.draws_multi = 0.1
+        self.C = kwargs.get('C', 5)
+        self.position = Position()
+
+    def select(self, node):
+        # Picks the child of `node` to descend into.
+        tree = self.tree
+        plays, wins, losses, draws, virtual = tree.plays, tree.wins, tree.losses, tree.draws, tree.virtual
+        first = tree.first_child[node]
+        children = range(first, first + tree.child_count[node])
+
+        # The counts are updated without a lock, so a lost update can
+        # leave them slightly off, even with `virtual` below zero.  They
+        # are clamped so that can't divide by zero or take the log of
+        # zero.
+        unvisited = [child for child in children if plays[child] + virtual[child] <= 0]
+        if unvisited:
+            return random.choice(unvisited)
+
+        draws_multi, C = self.draws_multi, self.C
+        log_total = math_log(max(1, sum(plays[child] + virtual[child] for child in children)))
+        best_value = -1
+        best = first
+        for child in children:
+            visits = max(1, (wins[child] + losses[child] + (draws_multi * draws[child]) or plays[child]) + virtual[child])
+            value = (wins[child] / visits) + C * sqrt(log_total / visits)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def run_simulation(self, root_state):
+        # Descends the shared tree from `root_state` to a new node,
+        # plays out a random game from there and backs up the result.
+        tree = self.tree
+        position = self.position
+        position.set(root_state)
+        node = 0
+        path = [0]
+        winner = position.winner()
+
+        t = 0
+        while winner == 0:
+            if tree.child_count[node] == -1:
+                with self.lock:
+                    if tree.child_count[node] == -1 and not tree.expand(node, position):
+                        break
+            if tree.child_count[node] == 0:
+                winner = -1
+                break
+
+            node = self.select(node)
+            tree.virtual[node] += 1
+            path.append(node)
+            position.play(tree.move[node])
+            t += 1
+            winner = position.winner()
+            if tree.plays[node] == 0:
+                break
+
+        if winner == 0:
+            winner = self.run_rollout(self.max_moves - t)
+
+        for node in path:
+            tree.plays[node] += 1
+            if node:
+                tree.virtual[node] -= 1
+            if winner > 0 and winner == tree.player[node]:
+                tree.wins[node] += 1
+            elif winner > 0:
+                tree.losses[node] += 1
+            elif winner < 0:
+                tree.draws[node] += 1
+
+    def run_rollout(self, max_moves):
+        # Plays random moves in place until the game ends.  Returns the
+        # winner, -1 for a draw, or 0 if the game didn't finish.
+        return self.position.rollout(max_moves=max_moves)
+
+
+def _worker(name, capacity, lock, root_state, seconds, seed, kwargs, results):
+    random.seed(seed)
+    tree = SharedTree(capacity, name)
+    search = TreeSearch(tree, lock, **kwargs)
+    games = 0
+    deadline = monotonic() + seconds
+    while monotonic() < deadline:
+        search.run_simulation(root_state)
+        games += 1
+    del search
+    tree.release()
+    results.put(games)
+
+
+class MonteCarlo(object):
+    def __init__(self, board, **kwargs):
+        # Takes an instance of a Board and optionally some keyword
+        # arguments.  Initializes the list of game states; the shared
+        # tree is created on the first search.
+        self.silent = kwargs.get('silent', False)
+        self.board = board
+        self.states = []
+        self.seconds = kwargs.get('time', 0.08)
+        self.workers = kwargs.get('workers', 2)
+        self.capacity = kwargs.get('nodes', 1000000)
+        # Seconds past the search time to wait for workers before
+        # giving up on them.
+        self.timeout = kwargs.get('timeout', 10)
+        self.draws_multi = 0.1
+        self.kwargs = kwargs
+        self.tree = None
+        self.lock = Lock()
+
+    def update(self, state):
+        # Takes a game state, and appends it to the history.
+        self.states.append(state)
+
+    def search(self, state, workers=None, seconds=None):
+        # Searches `state` with `workers` processes sharing one tree for
+        # `seconds`.  Returns the total number of simulations run.
+        workers = workers or self.workers
+        seconds = self.seconds if seconds is None else seconds
+        if self.tree is None:
+            self.tree = SharedTree(self.capacity)
+        self.tree.reset(3 - self.board.current_player(state))
+
+        results = Queue()
+        seed = random.getrandbits(32)
+        processes = [
+            Process(target=_worker, args=(self.tree.name, self.capacity, self.lock, state,
+                                          seconds, seed + i, self.kwargs, results))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        # Wait for every worker's count, but give up as soon as one has
+        # died without sending it, or if they all overrun by far.
+        games = 0
+        received = 0
+        deadline = monotonic() + seconds + self.timeout
+        while received < workers:
+            try:
+                games += results.get(timeout=0.1)
+                received += 1
+            except Empty:
+                crashed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+                if crashed or monotonic() > deadline:
+                    for process in processes:
+                        process.terminate()
+                        process.join()
+                    raise RuntimeError('search worker failed (exit codes: {})'.format(
+                        [process.exitcode for process in processes]))
+        for process in processes:
+            process.join()
+        return games
+
+    def root_stats(self):
+        # Returns {move: (plays, wins, losses, draws)} for the children
+        # of the root.
+        tree = self.tree
+        first = tree.first_child[0]
+        return dict(
+            (tree.move[child], (tree.plays[child], tree.wins[child], tree.losses[child], tree.draws[child]))
+            for child in range(first, first + max(tree.child_count[0], 0))
+        )
+
+    def get_play(self):
+        # Causes the AI to calculate the best move from the
+        # current game state and return it.
+        state = self.states[-1]
+        legal = self.board.legal_plays(self.states[:])
+
+        # Bail out early if there is no real choice to be made.
+        if not legal:
+            return
+        if len(legal) == 1:
+            return legal[0]
+
+        begin = datetime.datetime.utcnow()
+        games = self.search(state)
+        stats = self.root_stats()
+
+        if not self.silent:
+            log('games: {} workers: {} time: {}'.format(games, self.workers, datetime.datetime.utcnow() - begin))
+
+        # Pick the move with the highest percentage of wins.
+        percent_wins, move = max(
+            (wins / (0.1 + wins + losses + (self.draws_multi * draws)), p)
+            for p, (plays, wins, losses, draws) in stats.items()
+        )
+        return move
+
+    def scaling(self, state, workers=(1, 2, 4, 8), seconds=None):
+        # Measures simulations/sec searching `state` with each number
+        # of workers.  Returns a list of dicts with the rate and the
+        # efficiency relative to perfect scaling from one worker.
+        seconds = self.seconds if seconds is None else seconds
+        results = []
+        for n in workers:
+            begin = datetime.datetime.utcnow()
+            games = self.search(state, workers=n, seconds=seconds)
+            elapsed = (datetime.datetime.utcnow() - begin).total_seconds()
+            results.append({'workers': n, 'simulations': games, 'seconds': elapsed,
+                            'per_second': games / elapsed})
+        base = results[0]['per_second'] / results[0]['workers']
+        for result in results:
+            result['efficiency'] = result['per_second'] / (base * result['workers'])
+        return results
+
+    def close(self):
+        # Frees the shared tree.
+        if self.tree is not None:
+            self.tree.release()
+            self.tree.shm.unlink()
+            self.tree = None
+
+
+def log(message=None):
+    if message is None:
+        print(file=sys.stderr)
+    else:
+        print(str(message), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    from ultimatetictactoe_online import Board
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    board = Board()
+    monty_carlo = MonteCarlo(board, time=seconds)
+    for result in monty_carlo.scaling(board.start()):
+        log('workers: {workers} simulations/sec: {per_second:.0f} efficiency: {efficiency:.2f}'.format(**result))
+    monty_carlo.close()
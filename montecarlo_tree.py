@@ -0,0 +1,513 @@
+import sys
+import random
+from math import sqrt
+from math import log as math_log
+from random import choice
+import datetime
+from time import perf_counter, monotonic
+from multiprocessing import Pool
+
+from bitboard import Position
+from searchengine import SearchEngine
+from searchstats import SearchStats
+from solver import Solver
+from timemanager import TimeManager
+from ultimatetictactoe_online import playout
+
+random.seed(10)
+
+
+class Node(object):
+    # A node of the search tree.  `player` is the player who moved into
+    # `state` by playing `move`, and wins/losses/draws are counted from
+    # that player's point of view.  `children` stays None until the
+    # node is first selected through.  `proven` is None until the
+    # node's result is known for certain, then 1, 0 or -1 for a win,
+    # draw or loss for `player`.
+    __slots__ = ('move', 'player', 'state', 'plays', 'wins', 'losses', 'draws', 'children', 'proven')
+
+    def __init__(self, move, player, state):
+        self.move = move
+        self.player = player
+        self.state = state
+        self.plays = 0
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+        self.children = None
+        self.proven = None
+
+
+class MonteCarlo(SearchEngine):
+    def __init__(self, board, **kwargs):
+        # Takes an instance of a Board and optionally some keyword
+        # arguments.  Initializes the list of game states and the
+        # search tree.
+        self.silent = kwargs.get('silent', False)
+        self.init_board(board, kwargs)
+        self.states = []
+        seconds = kwargs.get('time', 0.08)
+        self.calculation_time = datetime.timedelta(seconds=seconds)
+        # A timemanager.TimeManager decides when each search stops; the
+        # default gives every move `time` seconds.
+        self.time_manager = kwargs.get('time_manager') or TimeManager(seconds)
+        self.max_games_simulated = 10000
+        self.max_moves = kwargs.get('max_moves', 81)
+        self.draws_multi = 0.1
+        self.C = kwargs.get('C', 5)
+        self.init_rollout(kwargs)
+        # With an `evaluator` (an evaluator.Evaluator, a file of weights
+        # saved by one, or True for the built-in weights) playouts stop
+        # after `rollout_depth` moves, 0 meaning at the leaf itself, and
+        # the evaluator's score for an unfinished game is backed up
+        # instead of a result.  These playouts always run on the
+        # Position; batched playouts (batch > 1) still run to the end.
+        self.evaluator = kwargs.get('evaluator')
+        self.rollout_depth = None
+        if self.evaluator is not None:
+            from evaluator import Evaluator
+            if self.evaluator is True:
+                self.evaluator = Evaluator()
+            elif not isinstance(self.evaluator, Evaluator):
+                self.evaluator = Evaluator.load(self.evaluator)
+            self.rollout_depth = kwargs.get('rollout_depth', 6)
+            self.rollout = 'position'
+        self.root = None
+        # With more than one worker, get_play searches the root in
+        # that many processes at once.  The pool is started on first
+        # use and kept alive until close().
+        self.workers = kwargs.get('workers', 1)
+        self.pool = None
+        self.kwargs = kwargs
+        # With a batch size above one, leaves are collected `batch` at a
+        # time and played out together by batchrollout.BatchRollout,
+        # which needs NumPy.
+        self.batch = kwargs.get('batch', 1)
+        if self.batch > 1:
+            from batchrollout import BatchRollout
+            self.batch_rollout = BatchRollout(random.getrandbits(32), self.max_moves)
+        # Positions with at most `solver_threshold` empty cells left in
+        # open sub-boards are solved exactly instead of played out, and
+        # proven results are backed up the tree so proven subtrees get
+        # no more simulations.  `solver_nodes` caps each leaf's solve
+        # and `root_solver_nodes` the attempt to solve the root, whose
+        # time comes out of the move's budget.  The solver's table holds
+        # at most `solver_table_size` entries.
+        self.solver_threshold = kwargs.get('solver_threshold', 12)
+        self.solver = Solver(kwargs.get('solver_nodes', 500), kwargs.get('solver_table_size', 200000))
+        self.root_solver_nodes = kwargs.get('root_solver_nodes', 5000)
+        self.solver_position = Position()
+        self.init_stats(kwargs)
+        self.rollout_length = 0
+
+    def update(self, state):
+        # Takes a game state, and appends it to the history.
+        self.states.append(state)
+
+    def get_play(self):
+        # Causes the AI to calculate the best move from the
+        # current game state and return it.
+        self.max_depth = 0
+        state = self.states[-1]
+        legal = self.board.legal_plays(self.states[:])
+
+        # Bail out early if there is no real choice to be made.
+        if not legal:
+            return
+        if len(legal) == 1:
+            return legal[0]
+
+        begin = datetime.datetime.utcnow()
+        clock = monotonic()
+        if self.collect_stats:
+            self.stats = SearchStats()
+
+        # Solve small endgames outright.
+        self.solver.table = {}
+        if self.solver_threshold:
+            position = self.solver_position
+            position.set(state)
+            if position.open_cells() <= self.solver_threshold:
+                value, move = self.solver.best_play(position, self.root_solver_nodes)
+                if move is not None:
+                    if not self.silent:
+                        log('solved: {} value: {}'.format(move, value))
+                    self.time_manager.start(state, clock)
+                    self.time_manager.finish()
+                    self.finish_stats(0, begin)
+                    return move
+
+        if self.workers > 1:
+            games, stats = self.search_parallel(state, clock)
+        else:
+            games = self.search(state, clock)
+            stats = self.root_stats()
+
+        # Display the number of calls of `run_simulation` and the
+        # time elapsed.
+        if not self.silent:
+            log('games: {} time: {}'.format(games, datetime.datetime.utcnow() - begin))
+
+        # Pick the move with the highest percentage of wins, unless the
+        # search proved some moves won or lost.
+        proven = self.root_proven() if self.workers == 1 else {}
+        if 1 in proven.values():
+            move = min(p for p, value in proven.items() if value == 1)
+        else:
+            candidates = [p for p in stats if proven.get(p) != -1] or list(stats)
+            percent_wins, move = max(
+                (wins / (0.1 + wins + losses + (self.draws_multi * draws)), p)
+                for p, (plays, wins, losses, draws) in stats.items() if p in candidates
+            )
+
+        # Display the stats for each possible play.
+        if not self.silent:
+            for x in sorted(
+                (((100 * wins / (0.1 + wins + losses)), wins, losses, p)
+                 for p, (plays, wins, losses, draws) in stats.items()),
+                reverse=True
+            ):
+                log("{3}: {0:.2f}% ({1:g} / {2:g})".format(*x))
+            log("Maximum depth searched: {}".format(self.max_depth))
+
+        self.finish_stats(games, begin)
+        return move
+
+    def table_size(self):
+        # Returns the number of nodes in the tree and roughly how many
+        # bytes they hold, including their states and child lists.
+        if self.root is None:
+            return 0, 0
+        nodes = 0
+        size = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            size += sys.getsizeof(node) + sys.getsizeof(node.state)
+            if node.children is not None:
+                size += sys.getsizeof(node.children)
+                stack.extend(node.children)
+        return nodes, size
+
+    def search(self, state, begin=None):
+        # Runs simulations from `state` until the time or game budget
+        # is used up, timed from `begin` (see TimeManager.start).
+        # Returns the number of simulations run.
+        if self.root is None or self.root.state != state:
+            self.root = Node(-1, 0, state)
+
+        time_manager = self.time_manager
+        time_manager.start(state, begin)
+        run_simulation = self.run_simulation if self.stats is None else self.run_simulation_timed
+        games = 0
+        while (games < self.max_games_simulated and self.root.proven is None and
+               not time_manager.should_stop(games, self.leaders)):
+            if self.batch > 1:
+                games += self.run_batch()
+            else:
+                run_simulation()
+                games += 1
+        time_manager.finish()
+        return games
+
+    def leaders(self):
+        # Returns the visit counts of the two most visited root moves.
+        visits = sorted(node.plays for node in self.root.children or [])
+        return (visits[-1] if visits else 0), (visits[-2] if len(visits) > 1 else 0)
+
+    def root_proven(self):
+        # Returns {move: proven value} for the root's proven children.
+        return dict((node.move, node.proven) for node in self.root.children or []
+                    if node.proven is not None)
+
+    def root_stats(self):
+        # Returns {move: (plays, wins, losses, draws)} for the children
+        # of the root.
+        return dict((node.move, (node.plays, node.wins, node.losses, node.draws))
+                    for node in self.root.children or [])
+
+    def search_parallel(self, state, begin=None):
+        # Root parallelisation: every worker process searches `state`
+        # independently with its own random seed, and the statistics of
+        # the root's children are summed.  The workers time their
+        # searches from `begin`.  Returns the total number of
+        # simulations and the merged statistics.
+        if self.pool is None:
+            kwargs = dict(self.kwargs, workers=1, silent=True, time_manager=None)
+            self.pool = Pool(self.workers, initializer=_init_worker, initargs=(self.board, kwargs))
+
+        seed = random.getrandbits(32)
+        results = self.pool.map(_search_root, [(state, seed + i, begin) for i in range(self.workers)])
+
+        games = 0
+        stats = {}
+        for worker_games, worker_stats, worker_depth in results:
+            games += worker_games
+            self.max_depth = max(self.max_depth, worker_depth)
+            for p, counts in worker_stats.items():
+                total = stats.get(p, (0, 0, 0, 0))
+                stats[p] = tuple(a + b for a, b in zip(total, counts))
+        return games, stats
+
+    def close(self):
+        # Shuts down the worker pool, if there is one.
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def expand(self, node):
+        # Builds the children of a node, one per legal move.
+        if self.stats is not None:
+            begin = perf_counter()
+        board = self.board
+        state = node.state
+        player = board.current_player(state)
+        node.children = [Node(p, player, board.next_state(state, p))
+                         for p in board.legal_plays([state])]
+        if self.stats is not None:
+            self.stats.add_phase('expansion', perf_counter() - begin)
+
+    def select(self, node):
+        # Picks the child of `node` to descend into.
+        children = node.children
+        for child in children:
+            if not child.plays:
+                # Some moves have no stats yet, so just make an
+                # arbitrary decision.
+                return choice(children)
+
+        # If we have stats on all of the legal moves here, use them.
+        # Moves proven to lose are never worth another simulation,
+        # unless every move is, when any of them will do.
+        draws_multi, C = self.draws_multi, self.C
+        log_total = math_log(sum(child.plays for child in children))
+        best_value = -1
+        best = children[0]
+        for child in children:
+            if child.proven == -1:
+                continue
+            visits = child.wins + child.losses + (draws_multi * child.draws) or child.plays
+            value = (child.wins / visits) + C * sqrt(log_total / visits)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def run_simulation(self):
+        # Descends the tree to a node that has not been visited yet,
+        # plays out a "random" game from there, then updates the
+        # statistics of every node on the path with the result.
+        path, winner, t = self.descend()
+        if winner == 0:
+            winner = self.run_rollout(path[-1].state, self.max_moves - t)
+        if winner == 0 and self.evaluator is not None:
+            self.backpropagate_score(path, self.evaluator.evaluate(self.position))
+        else:
+            self.backpropagate(path, winner)
+
+    def run_simulation_timed(self):
+        # run_simulation, recording the time spent in each phase.
+        stats = self.stats
+        expansion = stats.phase_seconds['expansion']
+        begin = perf_counter()
+        path, winner, t = self.descend()
+        selected = perf_counter()
+        stats.add_phase('selection', selected - begin - (stats.phase_seconds['expansion'] - expansion))
+        stats.add_depth(t)
+        if winner == 0:
+            winner = self.run_rollout(path[-1].state, self.max_moves - t)
+            stats.add_rollout(self.rollout_length)
+        if winner == 0 and self.evaluator is not None:
+            score = self.evaluator.evaluate(self.position)
+        rolled_out = perf_counter()
+        stats.add_phase('rollout', rolled_out - selected)
+        if winner == 0 and self.evaluator is not None:
+            self.backpropagate_score(path, score)
+        else:
+            self.backpropagate(path, winner)
+        stats.add_phase('backpropagation', perf_counter() - rolled_out)
+
+    def run_batch(self):
+        # Descends the tree `batch` times, plays out all the new leaves
+        # at once with the batch rollout engine, then backs up the
+        # results.  Each descent counts as a loss on its path until its
+        # result is known, so the descents spread over different lines.
+        # Returns the number of simulations run.
+        descents = []
+        for _ in range(self.batch):
+            # Once the root is proven there is nothing left to search.
+            if self.root.proven is not None:
+                break
+            path, winner, t = self.descend()
+            for node in path:
+                node.plays += 1
+                node.losses += 1
+            descents.append((path, winner))
+
+        pending = [path for path, winner in descents if winner == 0]
+        if pending:
+            results = iter(self.batch_rollout.run([tuple(path[-1].state) for path in pending]))
+
+        for path, winner in descents:
+            if winner == 0:
+                winner = int(next(results))
+            for node in path:
+                node.plays -= 1
+                node.losses -= 1
+            self.backpropagate(path, winner)
+        return len(descents)
+
+    def descend(self):
+        # Walks from the root to the first node that has not been
+        # visited yet, or to the end of the game.  Returns the path, the
+        # winner (0 if the game isn't over) and the depth reached.
+        board = self.board
+        node = self.root
+        path = [node]
+        winner = board.winner([node.state])
+
+        t = 0
+        while winner == 0:
+            if node.children is None:
+                self.expand(node)
+            if not node.children:
+                winner = -1
+                break
+
+            node = self.select(node)
+            path.append(node)
+            t += 1
+            if node.proven is not None:
+                winner = self.proven_winner(node)
+                break
+            winner = board.winner([node.state])
+            if winner != 0:
+                node.proven = 1
+            elif node.plays == 0:
+                if t > self.max_depth:
+                    self.max_depth = t
+                value = self.solve(node.state)
+                if value is not None:
+                    # The solver scores the player to move, who is not
+                    # the player that moved into the node.
+                    node.proven = -value
+                    winner = self.proven_winner(node)
+                break
+
+        if winner == -1 and node.proven is None:
+            node.proven = 0
+        if node.proven is not None:
+            for parent in reversed(path[:-1]):
+                if not self.prove(parent):
+                    break
+        return path, winner, t
+
+    def solve(self, state):
+        # Returns the solver's value of `state` for the player to move,
+        # or None if it is too big to solve or couldn't be solved.
+        if not self.solver_threshold:
+            return None
+        position = self.solver_position
+        position.set(state)
+        if position.open_cells() > self.solver_threshold:
+            return None
+        return self.solver.solve(position)
+
+    def prove(self, node):
+        # Works out whether `node` is proven from its children: it is
+        # lost if any reply wins, and otherwise has the value of its
+        # best reply once every reply is proven.  Returns True if it
+        # is proven.
+        best = -1
+        unproven = False
+        for child in node.children:
+            if child.proven == 1:
+                node.proven = -1
+                return True
+            if child.proven is None:
+                unproven = True
+            elif child.proven > best:
+                best = child.proven
+        if unproven:
+            return False
+        node.proven = -best
+        return True
+
+    def proven_winner(self, node):
+        # Returns the winner, or -1 for a draw, of a proven node.
+        if node.proven == 1:
+            return node.player
+        if node.proven == -1:
+            return 3 - node.player
+        return -1
+
+    def backpropagate(self, path, winner):
+        # Adds the result of one simulation to every node on the path.
+        for node in path:
+            node.plays += 1
+            if winner > 0 and winner == node.player:
+                node.wins += 1
+            elif winner > 0:
+                node.losses += 1
+            elif winner < 0:
+                node.draws += 1
+
+    def backpropagate_score(self, path, score):
+        # Adds an evaluated simulation to every node on the path: `score`
+        # is player 1's expected score, which counts as that fraction of
+        # a win for player 1 and the rest as a win for player 2.
+        for node in path:
+            node.plays += 1
+            if node.player == 1:
+                node.wins += score
+                node.losses += 1 - score
+            else:
+                node.wins += 1 - score
+                node.losses += score
+
+    def run_rollout(self, state, max_moves):
+        # Plays random moves from `state` until the game ends or
+        # `max_moves` have been made, or `rollout_depth` moves if set.
+        # Returns the winner, -1 for a draw, or 0 if the game didn't
+        # finish.  The number of moves played is left in rollout_length.
+        if self.rollout_depth is not None:
+            max_moves = min(max_moves, self.rollout_depth)
+        if self.rollout == 'position':
+            position = self.position
+            position.set(state)
+            winner = position.rollout(self.next_move, max_moves)
+            plies = position.ply
+        else:
+            states = [state]
+            winner = playout(self.playout_board, states, max_moves)
+            plies = len(states) - 1
+        self.rollout_length = plies
+        return winner
+
+
+# The engine owned by each worker process of a root-parallel search.
+_worker_engine = None
+
+
+def _init_worker(board, kwargs):
+    global _worker_engine
+    _worker_engine = MonteCarlo(board, **kwargs)
+
+
+def _search_root(args):
+    state, seed, begin = args
+    random.seed(seed)
+    engine = _worker_engine
+    engine.root = None
+    engine.max_depth = 0
+    games = engine.search(state, begin)
+    return games, engine.root_stats(), engine.max_depth
+
+
+def log(message=None):
+    if message is None:
+        print(file=sys.stderr)
+    else:
+        print(str(message), file=sys.stderr)
@@ -0,0 +1,114 @@
+import sys
+import mmap
+import struct
+import argparse
+
+from bitboard import zobrist
+from ultimatetictactoe_online import Board, MonteCarlo, log
+
+# File layout: a header holding MAGIC and the number of records, then
+# fixed-size records sorted by key.  Each record is the Zobrist key of
+# a position, the move to play there and the number of simulations
+# behind it (capped at 65535).
+MAGIC = b'UTTTBOOK'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<QBxH')
+
+
+class OpeningBook(object):
+    # Looks up book moves in a book file.  The file is mapped into
+    # memory and searched in place, so opening a book costs nothing no
+    # matter how big it is.
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not an opening book'.format(path))
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, state):
+        # Returns the book move for `state`, or None if it isn't in the
+        # book.
+        key = zobrist(state)
+        data = self.data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, move, games = RECORD.unpack_from(data, HEADER.size + middle * RECORD.size)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return move
+        return None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def write(path, entries):
+    # Writes {key: (move, games)} to a book file.
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        for key in sorted(entries):
+            move, games = entries[key]
+            f.write(RECORD.pack(key, move, min(games, 65535)))
+
+
+def build(depth=2, seconds=1.0, width=None, **kwargs):
+    # Searches the opening with MonteCarlo and returns the book as
+    # {key: (move, games)}.  Lines start from the empty board and from
+    # every possible first move, with either player starting, so the
+    # book covers both moving first and second.  From each position
+    # the book move is played and the line continues into the opponent's
+    # replies (only the `width` most searched ones, if given) for
+    # `depth` of our moves.
+    board = Board()
+    entries = {}
+    frontier = []
+    for starting_player in (1, 2):
+        start = tuple([-1 for _ in range(9*9)] + [-1 for _ in range(9)] + [starting_player, -1])
+        frontier.append(start)
+        frontier.extend(board.next_state(start, p) for p in board.legal_plays([start]))
+
+    for ply in range(depth):
+        next_frontier = []
+        for n, state in enumerate(frontier):
+            key = zobrist(state)
+            if key in entries or not board.legal_plays([state]) or board.winner([state]):
+                continue
+
+            monty_carlo = MonteCarlo(board, time=seconds, silent=True, **kwargs)
+            monty_carlo.max_games_simulated = sys.maxsize
+            monty_carlo.update(state)
+            move = monty_carlo.get_play()
+            entries[key] = (move, monty_carlo.games)
+            log('depth {} position {}/{}: {} ({} games)'.format(ply + 1, n + 1, len(frontier), move, monty_carlo.games))
+
+            after = board.next_state(state, move)
+            if board.winner([after]):
+                continue
+            opponent = board.current_player(after)
+            replies = [board.next_state(after, p) for p in board.legal_plays([after])]
+            replies.sort(key=lambda S: monty_carlo.plays.get((opponent, S), 0), reverse=True)
+            next_frontier.extend(replies[:width])
+        frontier = next_frontier
+    return entries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book.')
+    parser.add_argument('path', help='book file to write')
+    parser.add_argument('--depth', type=int, default=2, help='number of our moves to cover in each line')
+    parser.add_argument('--time', type=float, default=1.0, help='seconds to search each position')
+    parser.add_argument('--width', type=int, default=None, help='opponent replies to follow from each position')
+    args = parser.parse_args()
+
+    entries = build(args.depth, args.time, args.width)
+    write(args.path, entries)
+    log('wrote {} positions to {}'.format(len(entries), args.path))
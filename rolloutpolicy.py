@@ -0,0 +1,83 @@
+from random import random
+
+from bitboard import WIN_TABLE, CELLS, POPCOUNT, BIT, FULL
+
+
+def _win_cells():
+    # WIN_CELLS[own << 9 | theirs] is the 9-bit mask of the empty cells
+    # that would complete a line for the player with marks `own` on a
+    # sub-board where the other player has `theirs`.  Only the 3^9
+    # masks that don't overlap are filled in.
+    table = [0] * (1 << 18)
+    for own in range(512):
+        if WIN_TABLE[own]:
+            continue
+        free = ~own & FULL
+        theirs = free
+        while True:
+            wins = 0
+            for c in CELLS[free & ~theirs]:
+                if WIN_TABLE[own | BIT[c]]:
+                    wins |= BIT[c]
+            table[own << 9 | theirs] = wins
+            if not theirs:
+                break
+            theirs = (theirs - 1) & free
+    return table
+
+
+WIN_CELLS = _win_cells()
+
+def _pick(choices, total):
+    # Returns a uniformly random move from `choices`, a list of
+    # (quadrant, 9-bit mask of cells) holding `total` cells in all.
+    r = int(random() * total)
+    for quadrant, cells in choices:
+        cells = CELLS[cells]
+        if r < len(cells):
+            return quadrant * 9 + cells[r]
+        r -= len(cells)
+
+
+def policy_play(position):
+    # Returns a legal move for the player to move in a
+    # bitboard.Position, or -1 if there are none.  Moves that win a
+    # sub-board come first, then moves that block the opponent from
+    # winning one, each chosen uniformly over every sub-board the
+    # player may play in.  Otherwise the move is random, avoiding cells
+    # that would send the opponent to a closed sub-board and so give
+    # them a free choice, unless there is nothing else.
+    player = position.player
+    mine, theirs = position.masks[player], position.masks[3 - player]
+    closed = position.meta[1] | position.meta[2] | position.drawn
+    quadrants = CELLS[position._open()]
+
+    wins = []
+    blocks = []
+    win_total = block_total = 0
+    for quadrant in quadrants:
+        a, b = mine[quadrant], theirs[quadrant]
+        cells = WIN_CELLS[a << 9 | b]
+        if cells:
+            wins.append((quadrant, cells))
+            win_total += POPCOUNT[cells]
+        elif not wins:
+            cells = WIN_CELLS[b << 9 | a]
+            if cells:
+                blocks.append((quadrant, cells))
+                block_total += POPCOUNT[cells]
+    if wins:
+        return _pick(wins, win_total)
+    if blocks:
+        return _pick(blocks, block_total)
+
+    safe = []
+    total = 0
+    for quadrant in quadrants:
+        cells = ~(mine[quadrant] | theirs[quadrant] | closed) & FULL
+        if cells:
+            safe.append((quadrant, cells))
+            total += POPCOUNT[cells]
+    if total == 0:
+        return position.random_play()
+    return _pick(safe, total)
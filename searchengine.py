@@ -0,0 +1,73 @@
+import datetime
+from functools import partial
+
+from bitboard import Position
+
+
+class SearchEngine(object):
+    # The options and search stats montecarlo_new and montecarlo_tree
+    # have in common.  Each engine calls the init_* methods from its
+    # __init__ and defines table_size() for its own statistics.
+    def init_board(self, board, kwargs):
+        # With symmetry=True the board is wrapped in a
+        # symmetry.SymmetricBoard, which drops moves that lead to
+        # rotations or reflections of positions other moves lead to;
+        # symmetry='canonical' also pools the statistics of symmetric
+        # positions reached by different lines.
+        # Playouts don't need canonical states, so they step the
+        # unwrapped board.
+        self.board = board
+        self.playout_board = board
+        symmetry = kwargs.get('symmetry')
+        if symmetry:
+            from symmetry import SymmetricBoard
+            if isinstance(board, SymmetricBoard):
+                self.playout_board = board.board
+            else:
+                self.board = SymmetricBoard(board, canonical=symmetry == 'canonical')
+
+    def init_rollout(self, kwargs):
+        # 'states' plays rollouts through board.next_state, 'position'
+        # plays them in place on a reusable bitboard.Position.
+        self.rollout = kwargs.get('rollout', 'states')
+        self.position = Position()
+        # With policy='tables', playouts pick their moves with
+        # rolloutpolicy.policy_play instead of uniformly at random.  The
+        # policy works on the Position, so it implies rollout='position'.
+        self.policy = kwargs.get('policy', 'uniform')
+        if self.policy == 'tables':
+            from rolloutpolicy import policy_play
+            self.next_move = partial(policy_play, self.position)
+            self.rollout = 'position'
+        elif self.policy == 'uniform':
+            self.next_move = self.position.random_play
+        else:
+            raise ValueError('unknown rollout policy {!r}'.format(self.policy))
+
+    def init_stats(self, kwargs):
+        # With stats=True every get_play fills in a searchstats.SearchStats,
+        # kept in last_stats and appended to `stats_file` if given.
+        self.collect_stats = kwargs.get('stats', False)
+        self.stats_file = kwargs.get('stats_file')
+        self.stats = None
+        self.last_stats = None
+
+    def get_play_with_stats(self):
+        # Like get_play, but returns (move, SearchStats); the stats are
+        # None unless the engine was created with stats=True.
+        self.last_stats = None
+        move = self.get_play()
+        return move, self.last_stats
+
+    def finish_stats(self, games, begin):
+        # Completes the stats of the search that just ran.
+        stats = self.stats
+        if stats is None:
+            return
+        stats.simulations = games
+        stats.seconds = (datetime.datetime.utcnow() - begin).total_seconds()
+        stats.table_entries, stats.table_bytes = self.table_size()
+        self.last_stats = stats
+        self.stats = None
+        if self.stats_file:
+            stats.write(self.stats_file)
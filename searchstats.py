@@ -0,0 +1,57 @@
+import json
+
+PHASES = ('selection', 'expansion', 'rollout', 'backpropagation')
+
+
+class SearchStats(object):
+    # Counters for one search.  Engines only fill these in when they are
+    # created with stats=True, so a disabled engine pays for a single
+    # attribute check per simulation.
+    def __init__(self):
+        self.simulations = 0
+        self.seconds = 0.0
+        self.phase_seconds = dict((phase, 0.0) for phase in PHASES)
+        self.phase_calls = dict((phase, 0) for phase in PHASES)
+        self.rollouts = 0
+        self.rollout_plies = 0
+        self.depths = {}
+        self.table_entries = 0
+        self.table_bytes = 0
+        self.evictions = 0
+
+    def add_phase(self, phase, seconds):
+        self.phase_seconds[phase] += seconds
+        self.phase_calls[phase] += 1
+
+    def add_rollout(self, plies):
+        self.rollouts += 1
+        self.rollout_plies += plies
+
+    def add_depth(self, depth):
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+
+    def simulations_per_second(self):
+        return self.simulations / self.seconds if self.seconds else 0.0
+
+    def average_rollout_length(self):
+        return self.rollout_plies / self.rollouts if self.rollouts else 0.0
+
+    def to_dict(self):
+        return {
+            'simulations': self.simulations,
+            'seconds': self.seconds,
+            'simulations_per_second': self.simulations_per_second(),
+            'phase_seconds': self.phase_seconds,
+            'phase_calls': self.phase_calls,
+            'rollouts': self.rollouts,
+            'average_rollout_length': self.average_rollout_length(),
+            'depths': dict((str(depth), count) for depth, count in sorted(self.depths.items())),
+            'table_entries': self.table_entries,
+            'table_bytes': self.table_bytes,
+            'evictions': self.evictions,
+        }
+
+    def write(self, path):
+        # Appends the stats to `path` as one JSON line.
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
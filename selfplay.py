@@ -0,0 +1,162 @@
+import os
+import gzip
+import time
+import random
+import struct
+import argparse
+from multiprocessing import Pool
+
+from ultimatetictactoe_online import Board, log
+from tournament import load_engine, close_engines
+
+# Shard layout: gzip-compressed, a header holding MAGIC and the record
+# size, then one record per position played.  A record is the 92-element
+# state, the number of times the search visited each of the 81 moves at
+# the root (capped at 65535), the move played, the winner of the game (1
+# or 2, or 0 for a draw) and the game's number.
+MAGIC = b'UTTTSELF'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<92b81HbbI')
+
+ENGINE = 'montecarlo_tree:MonteCarlo:rollout=position'
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, 'shard-{:05d}.bin.gz'.format(shard))
+
+
+def visit_counts(engine, move):
+    # Returns the root visit counts of the search that chose `move`, as
+    # a list indexed by move.  If the engine didn't search (a forced or
+    # solved move) all the visits go to `move`.
+    visits = [0] * 81
+    try:
+        stats = engine.root_stats()
+    except AttributeError:
+        stats = {}
+    for p, counts in stats.items():
+        visits[p] = min(counts[0], 65535)
+    if not any(visits):
+        visits[move] = 1
+    return visits
+
+
+def play_game(engine, seconds):
+    # Plays one game of `engine` against itself, with one instance per
+    # side kept for the whole game and closed when it ends.  Returns the
+    # winner (0 for a draw) and a list of (state, visits, move) for
+    # every position.
+    board = Board()
+    state = board.start()
+    engines = {1: engine(board, time=seconds, silent=True), 2: engine(board, time=seconds, silent=True)}
+    positions = []
+    winner = 0
+    try:
+        while board.legal_plays([state]):
+            monty_carlo = engines[board.current_player(state)]
+            monty_carlo.update(state)
+            move = monty_carlo.get_play()
+            positions.append((state, visit_counts(monty_carlo, move), move))
+            state = board.next_state(state, move)
+            winner = board.winner([state])
+            if winner > 0:
+                break
+    finally:
+        close_engines(engines.values())
+    return max(winner, 0), positions
+
+
+def play_shard(args):
+    # Plays the games of one shard and writes them to its file.  Each
+    # game is written as soon as it ends, so no more than one game is
+    # held in memory, and the file only gets its final name once every
+    # game is in it.  Returns the shard number and the number of
+    # positions written.
+    directory, shard, games_per_shard, games, spec, seconds, seed = args
+    engine = load_engine(spec)
+    path = shard_path(directory, shard)
+    count = 0
+    with gzip.open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, RECORD.size))
+        for game in range(shard * games_per_shard, min((shard + 1) * games_per_shard, games)):
+            random.seed(seed + game)
+            winner, positions = play_game(engine, seconds)
+            f.write(b''.join(RECORD.pack(*(tuple(state) + tuple(visits) + (move, winner, game)))
+                             for state, visits, move in positions))
+            count += len(positions)
+    os.replace(path + '.tmp', path)
+    return shard, count
+
+
+def read_shard(path):
+    # Yields (state, visits, move, winner, game) for every record of a
+    # shard.
+    with gzip.open(path, 'rb') as f:
+        magic, size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or size != RECORD.size:
+            raise ValueError('{} is not a self-play shard'.format(path))
+        while True:
+            data = f.read(RECORD.size)
+            if len(data) < RECORD.size:
+                break
+            record = RECORD.unpack(data)
+            yield record[:92], record[92:173], record[173], record[174], record[175]
+
+
+def load(paths):
+    # Returns the records of the shards in `paths` as one NumPy
+    # structured array with fields state, visits, move, winner and game.
+    import numpy as np
+    dtype = np.dtype([('state', 'i1', 92), ('visits', '<u2', 81), ('move', 'i1'), ('winner', 'i1'),
+                      ('game', '<u4')])
+    arrays = []
+    for path in paths:
+        with gzip.open(path, 'rb') as f:
+            magic, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or size != dtype.itemsize:
+                raise ValueError('{} is not a self-play shard'.format(path))
+            arrays.append(np.frombuffer(f.read(), dtype))
+    return np.concatenate(arrays) if arrays else np.zeros(0, dtype)
+
+
+def run(directory, games=64, games_per_shard=8, seconds=0.08, workers=None, seed=12345, engine=ENGINE):
+    # Plays `games` self-play games over a process pool, `games_per_shard`
+    # to a shard file in `directory`.  Shards already written by an
+    # earlier, interrupted run are skipped, so running again with the
+    # same arguments resumes it.  Returns the number of positions
+    # written.
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    shards = (games + games_per_shard - 1) // games_per_shard
+    todo = [shard for shard in range(shards) if not os.path.exists(shard_path(directory, shard))]
+    log('shards: {} done: {} to play: {}'.format(shards, shards - len(todo), len(todo)))
+
+    positions = 0
+    begin = time.time()
+    pool = Pool(workers)
+    try:
+        tasks = [(directory, shard, games_per_shard, games, engine, seconds, seed) for shard in todo]
+        for shard, count in pool.imap_unordered(play_shard, tasks):
+            positions += count
+            elapsed = time.time() - begin
+            log('shard {} done: {} positions, {:.1f} positions/sec'.format(shard, count, positions / elapsed))
+    finally:
+        pool.terminate()
+        pool.join()
+    elapsed = time.time() - begin
+    log('positions: {} time: {:.1f}s positions/sec: {:.1f}'.format(positions, elapsed, positions / elapsed if elapsed else 0.0))
+    return positions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate self-play games for training.')
+    parser.add_argument('directory', help='directory to write shards to')
+    parser.add_argument('--games', type=int, default=64)
+    parser.add_argument('--games-per-shard', type=int, default=8)
+    parser.add_argument('--time', type=float, default=0.08, help='seconds per move')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('--engine', default=ENGINE, help='engine as module:Class[:key=value,...]')
+    args = parser.parse_args()
+
+    run(args.directory, args.games, args.games_per_shard, args.time, args.workers, args.seed, args.engine)
@@ -0,0 +1,141 @@
+from bitboard import Position, WIN_TABLE, BIT
+
+EXACT, LOWER, UPPER = range(3)
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class Solver(object):
+    # Exact negamax search with alpha-beta pruning for endgames.  Values
+    # are from the point of view of the player to move: 1 for a win, 0
+    # for a draw and -1 for a loss.  Results are cached by Zobrist key
+    # in a transposition table, which also supplies the first move to
+    # try.  Otherwise moves that win a sub-board are tried first, then
+    # moves that stop the opponent winning one.  The table is emptied
+    # whenever it reaches `max_entries`, so it can't grow without bound
+    # over a long search.
+    def __init__(self, max_nodes=100000, max_entries=200000):
+        self.max_nodes = max_nodes
+        self.max_entries = max_entries
+        self.table = {}
+        self.nodes = 0
+        self.limit = max_nodes
+
+    def solve(self, position, max_nodes=None):
+        # Returns the value of `position`, or None if it couldn't be
+        # solved within `max_nodes` (by default the solver's max_nodes).
+        # The position is left unchanged.
+        value, move = self.best_play(position, max_nodes)
+        return value
+
+    def best_play(self, position, max_nodes=None):
+        # Returns (value, best move) for `position`, or (None, None) if
+        # it couldn't be solved within `max_nodes`.
+        self.nodes = 0
+        self.limit = max_nodes or self.max_nodes
+        ply = position.ply
+        try:
+            value = self.negamax(position, -1, 1)
+        except SearchAborted:
+            while position.ply > ply:
+                position.undo()
+            return None, None
+        entry = self.table.get(position.zobrist)
+        return value, entry[2] if entry else None
+
+    def ordered_plays(self, position, first):
+        # Returns the legal moves of `position`, most promising first.
+        player = position.player
+        mine, theirs = position.masks[player], position.masks[3 - player]
+        scored = []
+        for move in position.legal_plays():
+            quadrant, cell = divmod(move, 9)
+            if move == first:
+                score = 3
+            elif WIN_TABLE[mine[quadrant] | BIT[cell]]:
+                score = 2
+            elif WIN_TABLE[theirs[quadrant] | BIT[cell]]:
+                score = 1
+            else:
+                score = 0
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for score, move in scored]
+
+    def negamax(self, position, alpha, beta):
+        self.nodes += 1
+        if self.nodes > self.limit:
+            raise SearchAborted()
+
+        # The player who just moved is the only one who can have won.
+        if position.winner():
+            return -1
+
+        key = position.zobrist
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            value, flag, first = entry
+            if flag == EXACT:
+                return value
+            if flag == LOWER:
+                alpha = max(alpha, value)
+            elif flag == UPPER:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        plays = self.ordered_plays(position, first)
+        if not plays:
+            self.store(key, 0, EXACT, None)
+            return 0
+
+        original_alpha = alpha
+        best_value = -2
+        best_move = None
+        for move in plays:
+            position.play(move)
+            value = -self.negamax(position, -beta, -alpha)
+            position.undo()
+            if value > best_value:
+                best_value = value
+                best_move = move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.store(key, best_value, flag, best_move)
+        return best_value
+
+    def store(self, key, value, flag, move):
+        if len(self.table) >= self.max_entries and key not in self.table:
+            self.table.clear()
+        self.table[key] = (value, flag, move)
+
+
+if __name__ == '__main__':
+    import random
+    from ultimatetictactoe_online import Board
+
+    random.seed(1)
+    board = Board()
+    state = board.start()
+    position = Position(state)
+    while position.open_cells() > 14 and not position.winner():
+        move = position.random_play()
+        if move == -1:
+            break
+        position.play(move)
+
+    solver = Solver(max_nodes=10 ** 7)
+    board.print(tuple(position.state()))
+    print(solver.best_play(position), solver.nodes)
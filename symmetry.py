@@ -0,0 +1,191 @@
+from operator import itemgetter
+
+from bitboard import BitState, CELLS, FULL, ZOBRIST_CELLS, ZOBRIST_LAST, ZOBRIST_SIDE
+
+# The 8 rotations and reflections of a 3x3 board, as maps from a cell
+# (row * 3 + column) to the cell it moves to.  Index 0 is the identity.
+SQUARE = [
+    [r * 3 + c for r in range(3) for c in range(3)],
+    [c * 3 + (2 - r) for r in range(3) for c in range(3)],
+    [(2 - r) * 3 + (2 - c) for r in range(3) for c in range(3)],
+    [(2 - c) * 3 + r for r in range(3) for c in range(3)],
+    [r * 3 + (2 - c) for r in range(3) for c in range(3)],
+    [(2 - r) * 3 + c for r in range(3) for c in range(3)],
+    [c * 3 + r for r in range(3) for c in range(3)],
+    [(2 - c) * 3 + (2 - r) for r in range(3) for c in range(3)],
+]
+
+# The same symmetry applies to the sub-boards and to the cells inside
+# them, so the cell a move sends the opponent to moves with it.
+# PERMUTATIONS[k][i] is where index i of a 92-element state goes under
+# symmetry k; indices 90 and 91 (the player and last move) stay put,
+# though the last move's value is mapped with the cells.
+PERMUTATIONS = [
+    [square[i // 9] * 9 + square[i % 9] for i in range(81)] +
+    [81 + square[q] for q in range(9)] + [90, 91]
+    for square in SQUARE
+]
+
+INVERSES = [[perm.index(i) for i in range(92)] for perm in PERMUTATIONS]
+
+# MASKS[k][mask] is a 9-bit mask with its bits moved by symmetry k.
+MASKS = [[sum(1 << square[c] for c in CELLS[mask]) for mask in range(512)] for square in SQUARE]
+
+_getters = [itemgetter(*inverse[:91]) for inverse in INVERSES]
+
+
+def map_move(move, k):
+    # Returns the move that `move` becomes under symmetry k.
+    return PERMUTATIONS[k][move] if move != -1 else -1
+
+
+def unmap_move(move, k):
+    # Returns the move that becomes `move` under symmetry k.
+    return INVERSES[k][move] if move != -1 else -1
+
+
+def transform(state, k):
+    # Returns `state` under symmetry k.
+    if isinstance(state, BitState):
+        return _transform_bits(state, k)
+    return _getters[k](state) + (map_move(state[91], k),)
+
+
+def _bits(state, k):
+    # Returns the boards of a BitState under symmetry k.
+    masks, square = MASKS[k], SQUARE[k]
+    p1 = p2 = 0
+    for q in range(9):
+        shift = square[q] * 9
+        p1 |= masks[(state.p1 >> (q * 9)) & FULL] << shift
+        p2 |= masks[(state.p2 >> (q * 9)) & FULL] << shift
+    return p1, p2, map_move(state.last, k)
+
+
+def _transform_bits(state, k, bits=None):
+    p1, p2, last = bits or _bits(state, k)
+    masks = MASKS[k]
+    key = ZOBRIST_LAST[last + 1] ^ (ZOBRIST_SIDE if state.player == 2 else 0)
+    for q in range(9):
+        for c in CELLS[(p1 >> (q * 9)) & FULL]:
+            key ^= ZOBRIST_CELLS[1][q * 9 + c]
+        for c in CELLS[(p2 >> (q * 9)) & FULL]:
+            key ^= ZOBRIST_CELLS[2][q * 9 + c]
+    return BitState(p1, p2, masks[state.meta1], masks[state.meta2], masks[state.drawn],
+                    state.player, last, key)
+
+
+def canonical(state):
+    # Returns (canonical state, k): the least of the 8 symmetric
+    # variants of `state`, and the symmetry that maps `state` to it.
+    # Symmetric states have the same canonical state.
+    if isinstance(state, BitState):
+        bits, k = min((_bits(state, k), k) for k in range(8))
+        if k == 0:
+            return state, 0
+        return _transform_bits(state, k, bits), k
+    return min((transform(state, k), k) for k in range(8))
+
+
+def stabilizer(state):
+    # Returns the symmetries that map `state` to itself, identity first.
+    last = state[91]
+    bits = isinstance(state, BitState)
+    found = [0]
+    for k in range(1, 8):
+        if map_move(last, k) != last:
+            continue
+        if bits:
+            if _bits(state, k) == (state.p1, state.p2, last):
+                found.append(k)
+        elif transform(state, k) == state:
+            found.append(k)
+    return found
+
+
+def distinct_plays(state, plays):
+    # Returns the plays of `plays` that aren't the image of a smaller
+    # one under a symmetry of `state`; the plays left out lead to
+    # positions symmetric to those of plays kept.
+    symmetries = stabilizer(state)
+    if len(symmetries) == 1:
+        return plays
+    return [p for p in plays if p == min(map_move(p, k) for k in symmetries)]
+
+
+class SymmetricBoard(object):
+    # Wraps a Board to remove symmetric duplicates from the search.
+    #
+    # By default legal_plays leaves out every move that leads to a
+    # rotation or reflection of the position another move leads to.
+    # That happens when the position itself is symmetric, as in the
+    # opening and in symmetric free-choice positions, and costs one
+    # stabilizer() check per call.
+    #
+    # With canonical=True every state next_state returns is canonical
+    # as well, so an engine's statistics for symmetric positions reached
+    # by different lines are pooled too.  That costs a canonical() per
+    # child and is only worth it while symmetric transpositions are
+    # common.
+    #
+    # Either way the moves returned are moves of the state asked about,
+    # so the moves an engine picks at the (real) root are real moves.
+    # Playouts don't need canonical states; random_play and the other
+    # queries go straight to the wrapped board.
+    def __init__(self, board, canonical=False):
+        self.board = board
+        self.canonical = canonical
+        self._state = None
+        self._children = None
+
+    def start(self):
+        return self.board.start()
+
+    def current_player(self, state):
+        return self.board.current_player(state)
+
+    def next_state(self, state, play):
+        if not self.canonical:
+            return self.board.next_state(state, play)
+        if state is self._state and play in self._children:
+            return self._children[play]
+        return canonical(self.board.next_state(state, play))[0]
+
+    def children(self, state):
+        # Returns {move: canonical child} for one move per distinct
+        # canonical child of `state`.
+        if state is not self._state:
+            children = {}
+            seen = set()
+            for play in self.board.legal_plays([state]):
+                child = canonical(self.board.next_state(state, play))[0]
+                if child not in seen:
+                    seen.add(child)
+                    children[play] = child
+            self._state = state
+            self._children = children
+        return self._children
+
+    def legal_plays(self, state_history):
+        state = state_history[-1]
+        if self.canonical:
+            return list(self.children(state))
+        return distinct_plays(state, self.board.legal_plays(state_history))
+
+    def legal_count(self, state_history):
+        return self.board.legal_count(state_history)
+
+    def random_play(self, state_history):
+        return self.board.random_play(state_history)
+
+    def winner(self, state_history):
+        return self.board.winner(state_history)
+
+    def forced(self, state_history):
+        return self.board.forced(state_history)
+
+    def sub_winner(self, state):
+        return self.board.sub_winner(state)
+
+    def print(self, state):
+        return self.board.print(state)
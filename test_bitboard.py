@@ -0,0 +1,77 @@
+import random
+
+import bitboard
+from bitboard import Position, zobrist
+from ultimatetictactoe_online import Board, log
+
+GAMES = 200
+
+
+def random_games(games=GAMES, seed=12345):
+    # Yields random games on the tuple Board, each as the list of its
+    # states from the start to the end.
+    rng = random.Random(seed)
+    board = Board()
+    for _ in range(games):
+        state = board.start()
+        states = [state]
+        while board.legal_plays([state]) and not board.winner([state]):
+            state = board.next_state(state, rng.choice(board.legal_plays([state])))
+            states.append(state)
+        yield states
+
+
+def test_board_matches_tuple_board():
+    # Plays the same games on both boards and compares every query.
+    board = Board()
+    bits = bitboard.Board()
+    for states in random_games():
+        bit_state = bits.from_tuple(states[0])
+        for state, after in zip(states, states[1:] + [None]):
+            assert tuple(bit_state) == state
+            assert bit_state.zobrist == zobrist(state)
+            assert sorted(bits.legal_plays([bit_state])) == sorted(board.legal_plays([state]))
+            assert bits.legal_count([bit_state]) == board.legal_count([state])
+            assert bits.winner([bit_state]) == board.winner([state])
+            assert bits.forced([bit_state]) == board.forced([state])
+            if after is None:
+                break
+            bit_state = bits.next_state(bit_state, after[91])
+            assert bit_state == bits.from_tuple(after)
+
+
+def test_random_play_is_legal():
+    bits = bitboard.Board()
+    for states in random_games(50):
+        for state in states:
+            bit_state = bits.from_tuple(state)
+            play = bits.random_play([bit_state])
+            legal = bits.legal_plays([bit_state])
+            assert play in legal if legal else play == -1
+
+
+def test_position_matches_tuple_board():
+    # Plays each game forward on a Position, checking it against the
+    # tuple states, then undoes it back to the start.
+    board = Board()
+    position = Position()
+    for states in random_games(100):
+        position.set(states[0])
+        for state, after in zip(states, states[1:]):
+            assert sorted(position.legal_plays()) == sorted(board.legal_plays([state]))
+            assert position.winner() == board.winner([state])
+            assert position.forced() == board.forced([state])
+            position.play(after[91])
+            assert tuple(position.state()) == after
+            assert position.zobrist == zobrist(after)
+        for state in reversed(states[:-1]):
+            position.undo()
+            assert tuple(position.state()) == state
+            assert position.zobrist == zobrist(state)
+
+
+if __name__ == '__main__':
+    test_board_matches_tuple_board()
+    test_random_play_is_legal()
+    test_position_matches_tuple_board()
+    log('bitboard: ok')
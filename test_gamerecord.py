@@ -0,0 +1,86 @@
+import os
+import gzip
+import shutil
+import tempfile
+
+import bitboard
+from gamerecord import (PACKED_SIZE, pack, unpack, RecordWriter, open_records,
+                        unpack_array, read_games, convert)
+from selfplay import MAGIC, HEADER, RECORD
+from ultimatetictactoe_online import Board, log
+from test_bitboard import random_games
+
+GAMES = 100
+
+
+def test_pack_round_trip():
+    bits = bitboard.Board()
+    for states in random_games(GAMES, seed=2468):
+        for state in states:
+            data = pack(state)
+            assert len(data) == PACKED_SIZE
+            assert unpack(data) == state
+            assert pack(bits.from_tuple(state)) == data
+
+
+def test_record_file():
+    # Writes games in two sessions, then reads them back through the
+    # memory-mapped array and as games.
+    import numpy as np
+    games = list(random_games(GAMES, seed=1357))
+    board = Board()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'games.rec')
+        for part in (games[:GAMES // 2], games[GAMES // 2:]):
+            with RecordWriter(path) as writer:
+                for states in part:
+                    writer.write_game(states, max(board.winner([states[-1]]), 0))
+
+        records = open_records(path)
+        assert not records.flags.owndata and not records.flags.writeable
+        flat = [state for states in games for state in states]
+        assert len(records) == len(flat)
+        assert (unpack_array(records['state']) == np.array(flat, dtype=np.int8)).all()
+
+        read = list(read_games(path))
+        assert [game for game, winner, states, moves in read] == list(range(GAMES))
+        for (game, winner, states, moves), expected in zip(read, games):
+            assert states == expected
+            assert moves == [state[91] for state in expected[1:]]
+            assert winner == max(board.winner([expected[-1]]), 0)
+        del records
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_convert_shard():
+    # A self-play shard holds every position but the last, each with the
+    # move played from it; the converted games have to come out whole.
+    games = list(random_games(20, seed=97531))
+    board = Board()
+    directory = tempfile.mkdtemp()
+    try:
+        shard = os.path.join(directory, 'shard-00000.bin.gz')
+        with gzip.open(shard, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, RECORD.size))
+            for game, states in enumerate(games):
+                winner = max(board.winner([states[-1]]), 0)
+                for state, after in zip(states, states[1:]):
+                    f.write(RECORD.pack(*(state + (0,) * 81 + (after[91], winner, game))))
+
+        path = os.path.join(directory, 'games.rec')
+        assert convert([shard], path) == sum(len(states) for states in games)
+        for (game, winner, states, moves), expected in zip(read_games(path), games):
+            assert states == expected
+            assert moves == [state[91] for state in expected[1:]]
+            assert winner == max(board.winner([expected[-1]]), 0)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    test_pack_round_trip()
+    test_record_file()
+    test_convert_shard()
+    log('gamerecord: ok')
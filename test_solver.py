@@ -0,0 +1,73 @@
+import random
+
+from bitboard import Position
+from solver import Solver
+from ultimatetictactoe_online import Board, log
+
+ENDGAMES = 60
+MAX_OPEN = 9
+
+
+def minimax(board, state, cache):
+    # Plain negamax over the tuple Board: the value of `state` for the
+    # player to move, 1 for a win, 0 for a draw and -1 for a loss.
+    if state in cache:
+        return cache[state]
+    if board.winner([state]):
+        value = -1
+    else:
+        legal = board.legal_plays([state])
+        value = max(-minimax(board, board.next_state(state, p), cache) for p in legal) if legal else 0
+    cache[state] = value
+    return value
+
+
+def random_endgames(count=ENDGAMES, max_open=MAX_OPEN, seed=12345):
+    # Returns `count` unfinished positions with at most `max_open` empty
+    # cells left in open sub-boards, reached by random play.
+    rng = random.Random(seed)
+    board = Board()
+    position = Position()
+    endgames = []
+    while len(endgames) < count:
+        state = board.start()
+        while board.legal_plays([state]) and not board.winner([state]):
+            position.set(state)
+            if position.open_cells() <= max_open:
+                endgames.append(state)
+                break
+            state = board.next_state(state, rng.choice(board.legal_plays([state])))
+    return endgames
+
+
+def test_solver_matches_minimax():
+    board = Board()
+    solver = Solver(10 ** 6)
+    position = Position()
+    for state in random_endgames():
+        position.set(state)
+        value, move = solver.best_play(position)
+        assert value == minimax(board, state, {})
+        assert position.ply == 0
+        # The best move has to achieve the value.
+        if move is not None:
+            assert -minimax(board, board.next_state(state, move), {}) == value
+
+
+def test_aborted_solve_restores_position():
+    # A solve cut short by the node limit leaves the position as it was.
+    position = Position()
+    solver = Solver(5)
+    for state in random_endgames(10, 20, seed=1):
+        position.set(state)
+        key = position.zobrist
+        solver.table.clear()
+        if solver.solve(position) is None:
+            assert position.ply == 0 and position.zobrist == key
+            assert tuple(position.state()) == state
+
+
+if __name__ == '__main__':
+    test_solver_matches_minimax()
+    test_aborted_solve_restores_position()
+    log('solver: ok')
@@ -0,0 +1,88 @@
+import bitboard
+from symmetry import (PERMUTATIONS, INVERSES, transform, canonical, stabilizer,
+                      distinct_plays, map_move, unmap_move, SymmetricBoard)
+from ultimatetictactoe_online import Board, log
+from test_bitboard import random_games
+
+GAMES = 60
+
+
+def positions(games=GAMES):
+    for states in random_games(games, seed=54321):
+        for state in states:
+            yield state
+
+
+def test_permutations_are_inverses():
+    for perm, inverse in zip(PERMUTATIONS, INVERSES):
+        assert sorted(perm) == list(range(92))
+        assert [inverse[perm[i]] for i in range(92)] == list(range(92))
+    for k in range(8):
+        for move in range(-1, 81):
+            assert unmap_move(map_move(move, k), k) == move
+
+
+def test_transform_commutes_with_moves():
+    # Playing a move and then applying a symmetry gives the same state
+    # as applying the symmetry and playing the mapped move.
+    board = Board()
+    for state in positions(20):
+        for play in board.legal_plays([state]):
+            for k in range(8):
+                assert (transform(board.next_state(state, play), k) ==
+                        board.next_state(transform(state, k), map_move(play, k)))
+
+
+def test_canonical_is_invariant():
+    # Every symmetric variant of a state has the same canonical state,
+    # for tuples and BitStates alike.
+    bits = bitboard.Board()
+    for state in positions():
+        least, k = canonical(state)
+        assert transform(state, k) == least
+        bit_least, bit_k = canonical(bits.from_tuple(state))
+        assert bit_least == bits.from_tuple(transform(state, bit_k))
+        for j in range(8):
+            assert canonical(transform(state, j))[0] == least
+            assert canonical(bits.from_tuple(transform(state, j)))[0] == bit_least
+
+
+def test_stabilizer():
+    bits = bitboard.Board()
+    for state in positions(20):
+        found = stabilizer(state)
+        assert found == [k for k in range(8) if transform(state, k) == state]
+        assert stabilizer(bits.from_tuple(state)) == found
+
+
+def test_distinct_plays_cover_every_child():
+    # Every legal move leads to a position symmetric to that of some
+    # move kept, and no two moves kept lead to symmetric positions.
+    board = Board()
+    for state in positions(20):
+        legal = board.legal_plays([state])
+        kept = distinct_plays(state, legal)
+        kept_children = [canonical(board.next_state(state, p))[0] for p in kept]
+        assert len(set(kept_children)) == len(kept)
+        for play in legal:
+            assert canonical(board.next_state(state, play))[0] in kept_children
+
+
+def test_symmetric_board_canonical_children():
+    bits = bitboard.Board()
+    wrapped = SymmetricBoard(bits, canonical=True)
+    for state in positions(10):
+        state = bits.from_tuple(state)
+        for play in wrapped.legal_plays([state]):
+            child = wrapped.next_state(state, play)
+            assert child == canonical(bits.next_state(state, play))[0]
+
+
+if __name__ == '__main__':
+    test_permutations_are_inverses()
+    test_transform_commutes_with_moves()
+    test_canonical_is_invariant()
+    test_stabilizer()
+    test_distinct_plays_cover_every_child()
+    test_symmetric_board_canonical_children()
+    log('symmetry: ok')
@@ -0,0 +1,104 @@
+from time import monotonic
+
+
+class TimeManager(object):
+    # Decides how long a search may run.  The clock is only read every
+    # few simulations; the interval is retuned at each check so that
+    # checks happen about every `resolution` seconds, or it can be fixed
+    # with `check_every`.
+    #
+    # Without `adaptive` every move gets `move_time`.  With it:
+    #   - when `game_time` is set, the per-move budget is the remaining
+    #     game time spread over the moves we still expect to make,
+    #     otherwise it is `move_time`
+    #   - the budget is scaled by `criticality`, which gives more time
+    #     to middle-game positions and less to the opening and endgame
+    #   - the search stops early once the most visited root move can't
+    #     be overtaken in the time left
+    # A search never runs past `hard_limit - margin` seconds, nor past
+    # the game time still left (less the margin) when `game_time` is
+    # set.  `hard_limit` defaults to `move_time`, or to `max_factor`
+    # times it with `adaptive`.
+    def __init__(self, move_time=0.08, **kwargs):
+        self.move_time = move_time
+        self.adaptive = kwargs.get('adaptive', False)
+        self.game_time = kwargs.get('game_time')
+        self.margin = kwargs.get('margin', 0.01)
+        self.hard_limit = kwargs.get('hard_limit')
+        self.min_factor = kwargs.get('min_factor', 0.5)
+        self.max_factor = kwargs.get('max_factor', 2.0)
+        self.check_every = kwargs.get('check_every')
+        self.resolution = kwargs.get('resolution', 0.002)
+        self.used = 0.0
+        self.moves = 0
+        self.begin = None
+        self.budget = move_time
+        self.deadline = None
+        self.next_check = 1
+
+    def reset(self):
+        # Starts a new game.
+        self.used = 0.0
+        self.moves = 0
+
+    def criticality(self, state):
+        # Returns the factor the budget is scaled by in `state`.  It
+        # rises linearly from `min_factor` on an empty board to
+        # `max_factor` with half the cells filled, then falls again.
+        filled = sum(1 for i in range(81) if state[i] != -1)
+        closeness = 1 - abs(filled - 40.5) / 40.5
+        return self.min_factor + (self.max_factor - self.min_factor) * closeness
+
+    def start(self, state, begin=None):
+        # Begins timing a search from `state` and works out its budget.
+        # `begin` is the monotonic() time the move's thinking started,
+        # if that was before the search, so the earlier work is charged
+        # to the budget too.
+        self.begin = monotonic() if begin is None else begin
+        budget = self.move_time
+        if self.adaptive:
+            if self.game_time is not None:
+                empty = sum(1 for i in range(81) if state[i] == -1)
+                moves_left = max(1, (empty + 1) // 2)
+                budget = max(0.0, self.game_time - self.used) / moves_left
+            budget *= self.criticality(state)
+        hard_limit = self.hard_limit
+        if hard_limit is None:
+            hard_limit = self.move_time * (self.max_factor if self.adaptive else 1)
+        deadline = hard_limit - self.margin
+        if self.game_time is not None:
+            deadline = min(deadline, self.game_time - self.used - self.margin)
+        self.deadline = max(0.0, deadline)
+        self.budget = min(budget, self.deadline)
+        self.next_check = self.check_every or 1
+
+    def should_stop(self, games, leaders=None):
+        # Returns True when the search that has run `games` simulations
+        # should stop.  `leaders` is an optional callable returning the
+        # visit counts of the two most visited root moves; it is only
+        # called when the clock is read.
+        if games < self.next_check:
+            return False
+        elapsed = monotonic() - self.begin
+        if elapsed >= self.budget:
+            return True
+
+        rate = games / elapsed if elapsed > 0 else 0
+        if self.check_every:
+            self.next_check = games + self.check_every
+        else:
+            self.next_check = games + max(1, int(rate * self.resolution))
+
+        if self.adaptive and leaders is not None and rate:
+            best, second = leaders()
+            if best - second > rate * (self.budget - elapsed):
+                return True
+        return False
+
+    def finish(self):
+        # Ends the current search and charges its time to the game.
+        # Returns the time it took.
+        elapsed = monotonic() - self.begin
+        self.used += elapsed
+        self.moves += 1
+        return elapsed
@@ -0,0 +1,188 @@
+import json
+import math
+import random
+import argparse
+import importlib
+from ast import literal_eval
+from functools import partial
+from multiprocessing import Pool
+
+from ultimatetictactoe_online import Board, log
+
+
+def load_engine(spec):
+    # Takes 'module:Class', optionally followed by ':key=value,...'
+    # keyword arguments for the engine, and returns the class (with the
+    # keyword arguments bound).
+    module_name, _, rest = spec.partition(':')
+    class_name, _, options = rest.partition(':')
+    cls = getattr(importlib.import_module(module_name), class_name or 'MonteCarlo')
+    kwargs = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        try:
+            kwargs[key] = literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return partial(cls, **kwargs) if kwargs else cls
+
+
+def close_engines(engines):
+    # Shuts down whatever the engines hold open, such as worker pools.
+    for engine in engines:
+        close = getattr(engine, 'close', None)
+        if close is not None:
+            close()
+
+
+def play_game(args):
+    # Plays one game between engines `a` and `b` and returns a result
+    # record.  Colours alternate every game and the starting player
+    # every two games, so each pairing is played from both sides.  Each
+    # side keeps one engine for the whole game, closed when it ends.
+    index, a, b, seconds, seed = args
+    classes = {}
+    a_player = 1 if index % 2 == 0 else 2
+    classes[a_player] = load_engine(a)
+    classes[3 - a_player] = load_engine(b)
+    # Seed after loading the engines: some engine modules seed the
+    # random module when they are first imported.
+    random.seed(seed)
+    starting_player = 1 if (index // 2) % 2 == 0 else 2
+
+    board = Board()
+    engines = dict((player, cls(board, time=seconds, silent=True)) for player, cls in classes.items())
+    state = tuple([-1 for _ in range(9*9)] + [-1 for _ in range(9)] + [starting_player, -1])
+    winner = 0
+    moves = 0
+    try:
+        while True:
+            legal = board.legal_plays([state])
+            if not legal:
+                break
+            monty_carlo = engines[board.current_player(state)]
+            monty_carlo.update(state)
+            play = monty_carlo.get_play()
+            state = board.next_state(state, play)
+            moves += 1
+            winner = board.winner([state])
+            if winner > 0:
+                break
+    finally:
+        close_engines(engines.values())
+
+    if winner == a_player:
+        score = 1.0
+    elif winner > 0:
+        score = 0.0
+    else:
+        score = 0.5
+    return {'game': index, 'seed': seed, 'a_player': a_player, 'starting_player': starting_player,
+            'winner': winner, 'moves': moves, 'score': score}
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+class Results(object):
+    # Running totals for engine A's results against engine B.
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games
+
+    def variance(self):
+        # Returns the variance of a single game's score.
+        score = self.score()
+        return (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 +
+                self.losses * score ** 2) / self.games
+
+    def elo(self, z=1.96):
+        # Returns the Elo difference and the bounds of its confidence
+        # interval, `z` standard errors either side.
+        score = self.score()
+        error = z * math.sqrt(self.variance() / self.games)
+        return elo_from_score(score), elo_from_score(score - error), elo_from_score(score + error)
+
+    def llr(self, elo0, elo1):
+        # Returns the log-likelihood ratio of elo1 against elo0, using
+        # the normal approximation to the score distribution.
+        variance = self.variance()
+        if not variance:
+            return 0.0
+        score0, score1 = expected_score(elo0), expected_score(elo1)
+        return self.games * (score1 - score0) * (2 * self.score() - score0 - score1) / (2 * variance)
+
+
+def run(a, b, games=100, seconds=0.08, workers=None, seed=12345, output=None,
+        elo0=0, elo1=10, alpha=0.05, beta=0.05):
+    # Plays up to `games` games between engines `a` and `b` over a
+    # process pool, appending each result to `output` as a JSON line.
+    # Stops early once the SPRT of elo1 against elo0 accepts either.
+    # Returns the Results.
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    results = Results()
+    out = open(output, 'a') if output else None
+    pool = Pool(workers)
+    try:
+        tasks = [(i, a, b, seconds, seed + i) for i in range(games)]
+        for record in pool.imap_unordered(play_game, tasks):
+            results.add(record['score'])
+            if out:
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+
+            llr = results.llr(elo0, elo1)
+            elo, low, high = results.elo()
+            log('games: {} +{} ={} -{} elo: {:.1f} [{:.1f}, {:.1f}] llr: {:.2f} [{:.2f}, {:.2f}]'.format(
+                results.games, results.wins, results.draws, results.losses, elo, low, high, llr, lower, upper))
+            if llr <= lower or llr >= upper:
+                log('SPRT: {} accepted'.format('H1' if llr >= upper else 'H0'))
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+        if out:
+            out.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a match between two engines.')
+    parser.add_argument('a', help="engine A as module:Class[:key=value,...], e.g. montecarlo_tree:MonteCarlo:rollout=position,policy=tables")
+    parser.add_argument('b', help="engine B as module:Class, e.g. montecarlo_base:MonteCarlo")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--time', type=float, default=0.08, help='seconds per move')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('--output', help='JSONL file to append game results to')
+    parser.add_argument('--elo0', type=float, default=0)
+    parser.add_argument('--elo1', type=float, default=10)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    args = parser.parse_args()
+
+    run(args.a, args.b, args.games, args.time, args.workers, args.seed, args.output,
+        args.elo0, args.elo1, args.alpha, args.beta)
@@ -0,0 +1,134 @@
+from array import array
+
+from bitboard import zobrist
+
+PLAYS, WINS, DRAWS, LOSSES = range(4)
+
+
+def state_key(state):
+    # Returns the 64-bit Zobrist key of a state, using the key a
+    # bitboard.BitState already carries when there is one.
+    try:
+        key = state.zobrist
+    except AttributeError:
+        key = zobrist(state)
+    # Zero marks an empty slot.
+    return key or 1
+
+
+class TableView(object):
+    # One statistic of a TranspositionTable, looked up by the same
+    # (player, state) keys as the dicts in MonteCarlo, so the table can
+    # be used in their place.
+    def __init__(self, table, field):
+        self.table = table
+        self.values = table.fields[field]
+
+    def __contains__(self, key):
+        return self.table.find(state_key(key[1])) != -1
+
+    def __getitem__(self, key):
+        slot = self.table.find(state_key(key[1]))
+        if slot == -1:
+            raise KeyError(key)
+        return self.values[slot]
+
+    def get(self, key, default=None):
+        slot = self.table.find(state_key(key[1]))
+        if slot == -1:
+            return default
+        return self.values[slot]
+
+    def __setitem__(self, key, value):
+        table = self.table
+        slot = table.find(state_key(key[1]))
+        if slot == -1:
+            slot = table.insert(state_key(key[1]))
+        if slot != -1:
+            self.values[slot] = value
+
+    def __len__(self):
+        return len(self.table)
+
+
+class TranspositionTable(object):
+    # A fixed-size table of search statistics keyed on 64-bit Zobrist
+    # keys.  Entries live in buckets of two slots, chosen by the low
+    # bits of the key.  When both slots of a bucket are taken, the
+    # replacement policy decides what happens to a new entry:
+    #
+    #   'always'  replaces the less visited of the two entries
+    #   'visits'  does the same, but only if that entry has fewer than
+    #             `min_visits` plays; otherwise the new entry is dropped
+    #   'never'   drops the new entry
+    #
+    # plays/wins/draws/losses are TableViews that can stand in for the
+    # statistics dicts of MonteCarlo.
+    def __init__(self, size=1 << 20, replace='visits', min_visits=4):
+        if replace not in ('always', 'visits', 'never'):
+            raise ValueError('unknown replacement policy: {}'.format(replace))
+        buckets = 1
+        while buckets * 2 < size:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.replace = replace
+        self.min_visits = min_visits
+        self.keys = array('Q', bytes(8 * 2 * buckets))
+        self.fields = [array('q', bytes(8 * 2 * buckets)) for _ in range(4)]
+        self.used = 0
+        self.replaced = 0
+
+        self.plays = TableView(self, PLAYS)
+        self.wins = TableView(self, WINS)
+        self.draws = TableView(self, DRAWS)
+        self.losses = TableView(self, LOSSES)
+
+    def __len__(self):
+        return self.used
+
+    def find(self, key):
+        # Returns the slot holding `key`, or -1.
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] == key:
+            return slot
+        if keys[slot + 1] == key:
+            return slot + 1
+        return -1
+
+    def insert(self, key):
+        # Claims a slot for a new key according to the replacement
+        # policy and zeroes its statistics.  Returns the slot, or -1 if
+        # the entry was dropped.
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] and keys[slot + 1]:
+            if self.replace == 'never':
+                return -1
+            plays = self.fields[PLAYS]
+            if plays[slot + 1] < plays[slot]:
+                slot += 1
+            if self.replace == 'visits' and plays[slot] >= self.min_visits:
+                return -1
+            self.replaced += 1
+        elif keys[slot]:
+            slot += 1
+            self.used += 1
+        else:
+            self.used += 1
+
+        keys[slot] = key
+        for values in self.fields:
+            values[slot] = 0
+        return slot
+
+    def clear(self):
+        # Empties the table.
+        for i in range(len(self.keys)):
+            self.keys[i] = 0
+        self.used = 0
+        self.replaced = 0
+
+    def nbytes(self):
+        # Returns the memory held by the table's arrays.
+        return sum(a.itemsize * len(a) for a in [self.keys] + self.fields)
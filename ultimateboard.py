@@ -1,6 +1,16 @@
 from random import randint, choice
 import math
 
+# The lines of the meta-board, as 9-bit masks of sub-boards.
+META_LINES = [(1 << a) | (1 << b) | (1 << c) for a, b, c in
+              [(0,1,2), (3,4,5), (6,7,8), (0,4,8), (2,4,6), (0,3,6), (1,4,7), (2,5,8)]]
+
+# LIVE_LINES[blocked] is True when some line of the meta-board avoids
+# every sub-board in the 9-bit mask `blocked`.  With the sub-boards won
+# by the opponent or drawn as `blocked`, it says whether a player can
+# still win.
+LIVE_LINES = [any(not mask & line for line in META_LINES) for mask in range(512)]
+
 class Board(object):
     def start(self):
         # Returns a representation of the starting state of the game.
@@ -43,11 +53,17 @@ class Board(object):
         # game history, and returns the full list of moves that
         # are legal plays for the current player.
         state = state_history[-1]
-        legal_moves = []
-        for i in self.play_available(state):
-            if state[i] == -1:
-                legal_moves.append(i)
-        return legal_moves
+        return [i for i in self.play_available(state) if state[i] == -1]
+
+    def legal_count(self, state_history):
+        # Returns the number of legal plays.
+        return len(self.legal_plays(state_history))
+
+    def random_play(self, state_history):
+        # Returns a random legal play, or -1 if there are no legal
+        # plays.
+        legal = self.legal_plays(state_history)
+        return choice(legal) if legal else -1
 
     def play_available(self, state):
         last_play = state[91]
@@ -61,7 +77,7 @@ class Board(object):
             available = []
             for quadrant in range(9):
                 if state[81 + quadrant] == -1:
-                    available = available + list(range(quadrant*9, (quadrant+1)*9))
+                    available.extend(range(quadrant*9, (quadrant+1)*9))
             return available
 
 
@@ -70,6 +86,27 @@ class Board(object):
         state = state_history[-1]
         return self.sub_winner(state[81:91])
 
+    def forced(self, state_history):
+        # Returns -1 if neither player can still complete a line of the
+        # meta-board, so the game must end in a draw, the player who is
+        # the only one who still can, or 0 if both can.
+        state = state_history[-1]
+        blocked1 = blocked2 = 0
+        for quadrant in range(9):
+            x = state[81 + quadrant]
+            if x == 0:
+                blocked1 |= 1 << quadrant
+                blocked2 |= 1 << quadrant
+            elif x == 1:
+                blocked2 |= 1 << quadrant
+            elif x == 2:
+                blocked1 |= 1 << quadrant
+        live1 = LIVE_LINES[blocked1]
+        live2 = LIVE_LINES[blocked2]
+        if live1:
+            return 0 if live2 else 1
+        return 2 if live2 else -1
+
     def sub_winner(self, state):
         # Takes a sequence of game states representing the full
         # game history.  If the game is now won, return the player
@@ -1,15 +1,31 @@
+import os
 import sys
 import random
+import struct
 from random import randint
 import math
 from math import sqrt
 from math import log as math_log
 from random import choice
 import datetime
+from time import monotonic
 from copy import deepcopy
+from operator import itemgetter
+import threading
+from queue import Queue, Empty
 
 random.seed(10)
 
+# The lines of the meta-board, as 9-bit masks of sub-boards.
+META_LINES = [(1 << a) | (1 << b) | (1 << c) for a, b, c in
+              [(0,1,2), (3,4,5), (6,7,8), (0,4,8), (2,4,6), (0,3,6), (1,4,7), (2,5,8)]]
+
+# LIVE_LINES[blocked] is True when some line of the meta-board avoids
+# every sub-board in the 9-bit mask `blocked`.  With the sub-boards won
+# by the opponent or drawn as `blocked`, it says whether a player can
+# still win.
+LIVE_LINES = [any(not mask & line for line in META_LINES) for mask in range(512)]
+
 
 class MonteCarlo(object):
     def __init__(self, board, **kwargs):
@@ -21,23 +37,77 @@ class MonteCarlo(object):
         self.states = []
         seconds = kwargs.get('time', 0.08)
         self.calculation_time = datetime.timedelta(seconds=seconds)
+        self.resolution = kwargs.get('resolution', 0.002)
+        # The search stops `margin` seconds early, leaving time to pick
+        # the move and write it out.
+        self.margin = kwargs.get('margin', 0.01)
         self.max_games_simulated = 10000
-        self.max_moves = kwargs.get('max_moves', 100)
+        self.max_moves = kwargs.get('max_moves', 81)
         self.draws = {}
         self.draws_multi = 0.1
         self.wins = {}
         self.losses = {}
         self.plays = {}
         self.C = kwargs.get('C', 5)
+        self.games = 0
+        self.inherited = 0
+        self.max_depth = 0
+        # The player whose wins and losses the tables count.  None means
+        # the player to move in the first state of the history.
+        self.root_player = None
 
     def update(self, state):
         # Takes a game state, and appends it to the history.
         self.states.append(state)
 
+    def reroot(self, state):
+        # Makes `state` the new root of the search, keeping the
+        # statistics of every position that can still be reached from
+        # it and dropping the rest.  Returns the number of simulations
+        # the new root inherits from earlier searches.
+        self.prune(state, state[90])
+        self.states = [state]
+        self.root_player = state[90]
+        player = self.board.current_player(state)
+        self.inherited = sum(
+            self.plays.get((player, self.board.next_state(state, p)), 0)
+            for p in self.board.legal_plays(self.states))
+        return self.inherited
+
+    def ponder(self, state):
+        # Makes `state`, where the opponent is to move, the root of the
+        # search while still counting wins and losses for us, so that
+        # simulations run while waiting for the opponent are kept when
+        # we reroot into their reply.
+        player = 1 if state[90] == 2 else 2
+        self.prune(state, player)
+        self.states = [state]
+        self.root_player = player
+
+    def prune(self, state, player):
+        # Drops the statistics of positions that can't be reached from
+        # `state`.  Everything is dropped if the tables count wins for
+        # someone other than `player`.
+        root_player = self.root_player or (self.states[0][90] if self.states else player)
+        if root_player != player:
+            self.plays, self.wins, self.draws, self.losses = {}, {}, {}, {}
+            return
+
+        filled = [i for i in range(81) if state[i] != -1]
+        if filled:
+            marks = itemgetter(*filled)
+            root_marks = marks(state)
+            for key in [key for key in self.plays if marks(key[1]) != root_marks]:
+                del self.plays[key]
+                del self.wins[key]
+                del self.draws[key]
+                del self.losses[key]
+
     def get_play(self):
         # Causes the AI to calculate the best move from the
         # current game state and return it.
         self.max_depth = 0
+        self.games = 0
         state = deepcopy(self.states[-1])
         player = self.board.current_player(state)
         legal = self.board.legal_plays(self.states[:])
@@ -48,18 +118,30 @@ class MonteCarlo(object):
         if len(legal) == 1:
             return legal[0]
 
+        # Read the clock only every few simulations, retuning the
+        # interval from the rate so far so that it is read about every
+        # `resolution` seconds.
+        seconds = self.calculation_time.total_seconds() - self.margin
         games = 0
-        begin = datetime.datetime.utcnow()
-        while (datetime.datetime.utcnow() - begin < self.calculation_time) and (games < self.max_games_simulated):
+        next_check = 1
+        begin = monotonic()
+        while games < self.max_games_simulated:
+            if games >= next_check:
+                elapsed = monotonic() - begin
+                if elapsed >= seconds:
+                    break
+                rate = games / elapsed if elapsed > 0 else 0
+                next_check = games + max(1, int(rate * self.resolution))
             self.run_simulation()
             games += 1
+        self.games = games
 
         moves_states = [(p, self.board.next_state(state, p)) for p in legal]
 
         # Display the number of calls of `run_simulation` and the
         # time elapsed.
         if not self.silent:
-            log('games: {} time: {}'.format(games, datetime.datetime.utcnow() - begin))
+            log('games: {} time: {}'.format(games, datetime.timedelta(seconds=monotonic() - begin)))
 
         # Pick the move with the highest percentage of wins.
         percent_wins, move = max(
@@ -90,6 +172,7 @@ class MonteCarlo(object):
         # Plays out a "random" game from the current position,
         # then updates the statistics tables with the result.
         plays, wins, draws, losses = self.plays, self.wins, self.draws, self.losses
+        root_player = self.root_player or self.states[0][90]
 
         visited_states = set()
         states_copy = self.states[:]
@@ -141,13 +224,19 @@ class MonteCarlo(object):
             if winner != 0:
                 break
 
+            # Past the newly expanded node the rest of the game is a
+            # playout.
+            if not expand:
+                winner = playout(self.board, states_copy, self.max_moves - t)
+                break
+
         for player, state in visited_states:
             if (player, state) not in plays:
                 continue
             plays[(player, state)] += 1
-            if winner > 0 and winner == self.states[0][90]:
+            if winner > 0 and winner == root_player:
                 wins[(player, state)] += 1
-            elif winner > 0 and winner != self.states[0][90]:
+            elif winner > 0 and winner != root_player:
                 losses[(player, state)] += 1
             elif winner < 0:
                 draws[(player, state)] += 1
@@ -195,11 +284,17 @@ class Board(object):
         # game history, and returns the full list of moves that
         # are legal plays for the current player.
         state = state_history[-1]
-        legal_moves = []
-        for i in self.play_available(state):
-            if state[i] == -1:
-                legal_moves.append(i)
-        return legal_moves
+        return [i for i in self.play_available(state) if state[i] == -1]
+
+    def legal_count(self, state_history):
+        # Returns the number of legal plays.
+        return len(self.legal_plays(state_history))
+
+    def random_play(self, state_history):
+        # Returns a random legal play, or -1 if there are no legal
+        # plays.
+        legal = self.legal_plays(state_history)
+        return choice(legal) if legal else -1
 
     def play_available(self, state):
         last_play = state[91]
@@ -213,7 +308,7 @@ class Board(object):
             available = []
             for quadrant in range(9):
                 if state[81 + quadrant] == -1:
-                    available = available + list(range(quadrant*9, (quadrant+1)*9))
+                    available.extend(range(quadrant*9, (quadrant+1)*9))
             return available
 
 
@@ -222,6 +317,27 @@ class Board(object):
         state = state_history[-1]
         return self.sub_winner(state[81:91])
 
+    def forced(self, state_history):
+        # Returns -1 if neither player can still complete a line of the
+        # meta-board, so the game must end in a draw, the player who is
+        # the only one who still can, or 0 if both can.
+        state = state_history[-1]
+        blocked1 = blocked2 = 0
+        for quadrant in range(9):
+            x = state[81 + quadrant]
+            if x == 0:
+                blocked1 |= 1 << quadrant
+                blocked2 |= 1 << quadrant
+            elif x == 1:
+                blocked2 |= 1 << quadrant
+            elif x == 2:
+                blocked1 |= 1 << quadrant
+        live1 = LIVE_LINES[blocked1]
+        live2 = LIVE_LINES[blocked2]
+        if live1:
+            return 0 if live2 else 1
+        return 2 if live2 else -1
+
     def sub_winner(self, state):
         # Takes a sequence of game states representing the full
         # game history.  If the game is now won, return the player
@@ -267,43 +383,126 @@ def log(message=None):
     else:
         print(str(message), file=sys.stderr)
 
+def playout(board, states, max_moves):
+    # Plays random moves on `board` from the last of `states` until the
+    # game ends or `max_moves` have been made, appending each new state
+    # to `states`.  Moves are picked before the state they lead to is
+    # built.  Returns the winner, -1 for a draw, or 0 if the game didn't
+    # finish.
+    state = states[-1]
+    for _ in range(max_moves):
+        play = board.random_play(states)
+        if play == -1:
+            return -1
+        state = board.next_state(state, play)
+        states.append(state)
+        winner = board.winner(states)
+        if winner != 0:
+            return winner
+        # Once neither player can complete a line of the meta-board the
+        # game can only be drawn.
+        if state[81 + play // 9] != -1 and board.forced(states) == -1:
+            return -1
+    return 0
+
 def convert_to_int(row, col):
     return col + row * 9
 
 def convert_to_row_col(num):
     return int(math.floor(num / 9)), num % 9
 
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening.book')
+
+def open_book(path):
+    # Returns the openingbook.OpeningBook at `path`, or None if there is
+    # no usable book.  The online runner only has this file, so a
+    # missing module is fine too.
+    try:
+        from openingbook import OpeningBook
+        return OpeningBook(path)
+    except (ImportError, OSError, ValueError, struct.error):
+        return None
+
+def start_reader():
+    # Reads stdin on a background thread so the engine can keep
+    # searching while it waits.  Returns a queue of the lines read,
+    # ending with None at end of input.
+    lines = Queue()
+
+    def read():
+        for line in sys.stdin:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    return lines
+
+def read_line(lines, monty_carlo=None):
+    # Returns the next line of input.  While none is waiting, runs
+    # simulations on `monty_carlo` if one is given.
+    while monty_carlo is not None:
+        try:
+            line = lines.get_nowait()
+            break
+        except Empty:
+            monty_carlo.run_simulation()
+    else:
+        line = lines.get()
+    if line is None:
+        raise EOFError
+    return line
+
 
 if __name__ == '__main__':
     board = Board()
     state = board.start()
+    # One engine for the whole game, so the statistics gathered for
+    # the subtree we move into are reused on the next turn.
+    monty_carlo = MonteCarlo(board)
+    # Keep searching below our last move while the opponent thinks.
+    lines = start_reader()
+    pondering = None
+    book = open_book(BOOK_PATH)
 
     while True:
         options = []
-        opponent_row, opponent_col = [int(i) for i in input().split()]
-        valid_action_count = int(input())
+        opponent_row, opponent_col = [int(i) for i in read_line(lines, pondering).split()]
+        valid_action_count = int(read_line(lines))
         for i in range(valid_action_count):
-            row, col = [int(j) for j in input().split()]
+            row, col = [int(j) for j in read_line(lines).split()]
             options.append((row, col))
             log("{}, {}".format(row, col))
 
-        # Take the middle
+        # Take the book move, or else the middle
         if opponent_row == -1:
-            print('4 4')
+            play = book.lookup(state) if book is not None else None
+            if play is None:
+                play = convert_to_int(4, 4)
+            state = board.next_state(state, play)
+            print('{} {}'.format(*convert_to_row_col(play)), flush=True)
             continue
 
         # Upgrade state with play
         play = convert_to_int(opponent_row, opponent_col)
         state = board.next_state(state, play)
 
-        monty_carlo = MonteCarlo(board)
-        monty_carlo.update(state)
-        play = monty_carlo.get_play()
+        monty_carlo.reroot(state)
+        play = book.lookup(state) if book is not None else None
+        if play is not None and play in board.legal_plays([state]):
+            log('book: {}'.format(play))
+        else:
+            play = monty_carlo.get_play()
+            log('inherited: {} new: {}'.format(monty_carlo.inherited, monty_carlo.games))
         state = board.next_state(state, play)
 
+        pondering = None
+        if board.winner([state]) == 0 and board.legal_plays([state]):
+            monty_carlo.ponder(state)
+            pondering = monty_carlo
+
         row, col = convert_to_row_col(play)
 
-        print('{} {}'.format(row, col))
+        print('{} {}'.format(row, col), flush=True)
 
 
 